@@ -6,10 +6,16 @@ Base class of SSVEP recognition method
 import abc
 from typing import Union, Optional, Dict, List, Tuple, Callable
 from numpy import ndarray
+import numpy as np
 
 class BaseModel(metaclass=abc.ABCMeta):
     """
     BaseModel
+
+    Note: Models follow the precision of EEG data and reference signals.
+          If both are float32, spatial filters, stored projections and correlations are kept in float32,
+          which halves the memory traffic of "predict". 
+          Inputs are not converted, so float64 results still follow matlab.
     """
     def __init__(self,
                  ID: str,
@@ -42,6 +48,44 @@ class BaseModel(metaclass=abc.ABCMeta):
         self.model = {}
         self.model['weights_filterbank'] = weights_filterbank
         
+    def _use_parallel(self) -> bool:
+        """
+        Whether computations are dispatched by joblib
+
+        A single job is computed in a plain loop to avoid the dispatch overhead of joblib.
+        """
+        return self.n_jobs is not None and self.n_jobs != 1
+
+    def get_weights_filterbank(self,
+                               filterbank_num: int) -> ndarray:
+        """
+        Weights of filterbanks used to combine correlations in "predict"
+
+        Parameters
+        ----------
+        filterbank_num : int
+            Number of filterbanks. Only used when 'weights_filterbank' is None.
+
+        Returns
+        -------
+        weights_filterbank : ndarray
+            Row vector of weights
+            shape: (1 * filterbank_num)
+        """
+        weights_filterbank = self.model['weights_filterbank']
+        if weights_filterbank is None:
+            weights_filterbank = [1 for _ in range(filterbank_num)]
+        if type(weights_filterbank) is list:
+            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
+        else:
+            if len(weights_filterbank.shape) != 2:
+                raise ValueError("'weights_filterbank' has wrong shape")
+            if weights_filterbank.shape[0] != 1:
+                weights_filterbank = weights_filterbank.T
+        if weights_filterbank.shape[0] != 1:
+            raise ValueError("'weights_filterbank' has wrong shape")
+        return weights_filterbank
+        
     @abc.abstractclassmethod
     def fit(self, *argv, **kwargs):
         """
@@ -14,9 +14,10 @@ import numpy as np
 
 from .basemodel import BaseModel
 from .utils import (
-    qr_remove_mean, qr_inverse, mldivide, canoncorr, qr_list, 
-    gen_template, sort, separate_trainSig, blkrep, blkmat, eigvec,
-    svd, repmat
+    qr_remove_mean, qr_list, qr_inverse_list,
+    gen_template, sort, separate_trainSig, blkrep, blkmat, eigvec, eigvec_sym,
+    svd, repmat, corrcoef_rows, max_singular_value, canoncorr_stack, normalize_rows,
+    sum_signed_square, pinv, pinv_list
 )
 
 def _msetcca_cal_template_U(X_single_stimulus : ndarray,
@@ -51,47 +52,32 @@ def _msetcca_cal_template_U(X_single_stimulus : ndarray,
     CCA_template = np.concatenate(CCA_template, axis = 0)
     return U_trial, CCA_template
 
-def _oacca_cal_u1_v1(filteredData : ndarray,
-                     sinTemplate : ndarray,
-                     old_Cxx : ndarray,
-                     old_Cxy : ndarray):
+def _oacca_cal_u1_v1(Cxx : ndarray,
+                     Cxy : ndarray):
     """
     Calculate online adaptive multi-stimulus spatial filter in OACCA
 
     Parameters
     --------------
-    filteredData : ndarray
-        input signal
-    sinTemplate : ndarray
-        reference signal
-    old_Cxx : ndarray
-        Covariance matrix of input signal in previous step
-    old_Cxy : ndarray
-        Covariance matrix of input signal and reference signal in previous step
+    Cxx : ndarray
+        Updated covariance matrix of input signal
+    Cxy : ndarray
+        Updated covariance matrix of input signal and reference signal
     """
     # Calculate multi-stimulus 
-    # filteredData = x_single_trial[k,:,:]
-    # sinTemplate = Y[prototype_res][:,:signal_len]
-
-    channel_num = filteredData.shape[0]
-    harmonic_num = sinTemplate.shape[0]
-
-    # self.model['Cxx'][:,:,k] = self.model['Cxx'][:,:,k] + filteredData @ filteredData.T
-    new_Cxx = old_Cxx + filteredData @ filteredData.T
-    # self.model['Cxy'][:,:,k] = self.model['Cxy'][:,:,k] + filteredData @ sinTemplate.T
-    new_Cxy = old_Cxy + filteredData @ sinTemplate.T
-
-    CCyy = np.eye(harmonic_num)
-    CCyx = new_Cxy.T
-    CCxx = new_Cxx
-    CCxy = new_Cxy
-    A1 = np.concatenate((np.zeros(CCxx.shape), CCxy), axis = 1)
-    A2 = np.concatenate((CCyx, np.zeros(CCyy.shape)), axis = 1)
-    A = np.concatenate((A1, A2), axis = 0)
-    B1 = np.concatenate((CCxx, np.zeros(CCxy.shape)), axis = 1)
-    B2 = np.concatenate((np.zeros(CCyx.shape), CCyy), axis = 1)
-    B = np.concatenate((B1, B2), axis = 0)
-    eig_vec = eigvec(A, B)
+    channel_num, harmonic_num = Cxy.shape
+
+    # A = [[0, Cxy], [Cyx, 0]] and B = [[Cxx, 0], [0, I]] are filled block by block
+    A = np.zeros((channel_num + harmonic_num, channel_num + harmonic_num), dtype = Cxy.dtype)
+    A[:channel_num, channel_num:] = Cxy
+    A[channel_num:, :channel_num] = Cxy.T
+    B = np.zeros_like(A)
+    B[:channel_num, :channel_num] = Cxx
+    B[channel_num:, channel_num:] = np.eye(harmonic_num)
+    # A is symmetric and B is symmetric positive definite. 
+    # Signs of u1 and v1 are flipped together, which does not change correlations.
+    # Only the eigenvector of the largest eigenvalue is required.
+    eig_vec = eigvec_sym(A, B, n_vec = 1)
     u1 = eig_vec[:channel_num,:]
     v1 = eig_vec[channel_num:,:]
     if u1[0,0] == 1:
@@ -101,35 +87,126 @@ def _oacca_cal_u1_v1(filteredData : ndarray,
     u1 = u1[:,0]
     v1 = v1[:,0]
 
-    return u1, v1, new_Cxx, new_Cxy
+    return u1, v1
 
-def _oacca_cal_u0(sf1x : ndarray, 
-                  old_covar_mat : ndarray):
+def _oacca_cal_u0(covar_mat : ndarray):
     """
     Calculate updated prototype filter in OACCA
 
     Parameters
     -------------
-    sf1x : ndarray
-        Spatial filter obtained from CCA
-    old_covar_mat : ndarray
-        Covariance matrix of spatial filter in previous step
+    covar_mat : ndarray
+        Updated covariance matrix of spatial filters
     """
-    channel_num = old_covar_mat.shape[0]
+    channel_num = covar_mat.shape[0]
 
-    # sf1x = cca_sfx[k,cca_res,:,:] 
-    sf1x = sf1x/np.linalg.norm(sf1x)
-    # sf1y = cca_sfy[k,cca_res,:,:]
-    # sf1y = sf1y/np.linalg.norm(sf1y)
-
-    # self.model['covar_mat'][:,:,k] = self.model['covar_mat'][:,:,k] + sf1x @ sf1x.T
-    new_covar_mat = old_covar_mat + sf1x @ sf1x.T
-    eig_vec = eigvec(new_covar_mat)
+    # "eigvec_sym" is not used because the prototype filter is applied to EEG data before CCA,
+    # and results depend on the sign of eigenvector returned by "eigvec".
+    eig_vec = eigvec(covar_mat)
     u0 = eig_vec[:channel_num,0]
-    return u0, new_covar_mat
-    
-    # for class_i in range(stimulus_num):
-    #     self.model['U0'][k,class_i,:,0] = u0 
+    return u0
+
+def _oacca_cal_filters(covar_mat : Optional[ndarray],
+                       Cxx : ndarray,
+                       Cxy : ndarray):
+    """
+    Calculate all updated filters of one filterbank in OACCA, 
+    so that all filterbanks can be updated in one parallel call
+
+    Parameters
+    -------------
+    covar_mat : Optional[ndarray]
+        Updated covariance matrix of spatial filters. 
+        If None, the prototype filter is not updated and None is returned for it.
+    Cxx : ndarray
+        Updated covariance matrix of input signal
+    Cxy : ndarray
+        Updated covariance matrix of input signal and reference signal
+
+    Returns
+    -------------
+    u0 : Optional[ndarray]
+        Prototype filter
+    u1 : ndarray
+        Multi-stimulus spatial filter
+    v1 : ndarray
+        Multi-stimulus weights of harmonics
+    """
+    u0 = None if covar_mat is None else _oacca_cal_u0(covar_mat)
+    u1, v1 = _oacca_cal_u1_v1(Cxx, Cxy)
+    return u0, u1, v1
+
+def _ecca_cal_r1_UV(X: ndarray,
+                    X_Q: ndarray,
+                    X_R: ndarray,
+                    X_P: ndarray,
+                    n_component: int,
+                    ref_sig: Optional[Tuple[List[ndarray], List[ndarray], List[ndarray], List[ndarray], ndarray]],
+                    template_sig: Optional[Tuple[List[ndarray], List[ndarray], List[ndarray], List[ndarray], ndarray]]):
+    """
+    Calculate r1, U1, V1 and U2 of one trial in eCCA, 
+    so that both CCAs of the trial share its QR decomposition and are computed in one task
+
+    Parameters
+    -------------
+    X : ndarray
+        Single trial EEG data
+        EEG shape: (filterbank_num, channel_num, signal_len)
+    X_Q, X_R, X_P : ndarray
+        QR decomposition of X generated by "qr_list"
+    n_component : int
+        Number of eigvectors for spatial filters.
+    ref_sig : Optional[Tuple]
+        Q, R, P, pseudo-inverse of R and stacked signals of references.
+        If None, r1, U1 and V1 are not calculated and None is returned for them.
+    template_sig : Optional[Tuple]
+        Q, R, P, pseudo-inverse of R and stacked signals of templates.
+        If None, U2 is not calculated and None is returned for it.
+
+    Returns
+    -------------
+    r1 : Optional[ndarray]
+    U1 : Optional[ndarray]
+    V1 : Optional[ndarray]
+    U2 : Optional[ndarray]
+    """
+    r1, U1, V1, U2 = None, None, None, None
+    if ref_sig is not None:
+        Y_Q, Y_R, Y_P, Y_R_pinv, Y = ref_sig
+        r1, U1, V1 = _r_cca_qr(X, Y_Q, Y_R, Y_P, n_component, True, Y = Y, 
+                               X_Q = X_Q, X_R = X_R, X_P = X_P, Y_R_pinv = Y_R_pinv)
+    if template_sig is not None:
+        Y_Q, Y_R, Y_P, Y_R_pinv, Y = template_sig
+        _, U2, _ = _r_cca_qr(X, Y_Q, Y_R, Y_P, n_component, True, Y = Y, 
+                             X_Q = X_Q, X_R = X_R, X_P = X_P, Y_R_pinv = Y_R_pinv)
+    return r1, U1, V1, U2
+
+def _stack_trial_filters(filters: List[ndarray],
+                         trial_num: int) -> ndarray:
+    """
+    Stack stored filters of trials so that the i-th filter is paired with the i-th test trial
+
+    Filters are stored by a previous prediction. 
+    As pairing by "zip", filters of extra trials are not used, 
+    and an error is raised if there are fewer filters than test trials.
+
+    Parameters
+    ----------
+    filters : List[ndarray]
+        Stored filters of trials
+    trial_num : int
+        Number of test trials
+
+    Returns
+    -------
+    filters : ndarray
+        Stacked filters
+        shape: (trial_num * ...)
+    """
+    if len(filters) < trial_num:
+        raise ValueError("Stored spatial filters are computed for {:d} trials, but {:d} trials are given. ".format(len(filters), trial_num)
+                         + "Set 'update_UV' to True to compute filters of these trials.")
+    return np.stack(filters[:trial_num])
 
 def _r_cca_canoncorr_withUV(X: ndarray,
                             Y: List[ndarray],
@@ -138,75 +215,157 @@ def _r_cca_canoncorr_withUV(X: ndarray,
     """
     Calculate correlation of CCA based on canoncorr for single trial data using existing U and V
 
+    Several trials can be computed in one call by stacking them along a leading axis.
+    U and V can be shared by all trials or stacked in the same way.
+
     Parameters
     ----------
     X : ndarray
         Single trial EEG data
         EEG shape: (filterbank_num, channel_num, signal_len)
+        or stacked EEG data: (trial_num, filterbank_num, channel_num, signal_len)
     Y : List[ndarray]
         List of reference signals
+        It can also be given as one array stacked along the first axis,
+        so that signals shared by many calls are stacked only once.
     U : ndarray
         Spatial filter
         shape: (filterbank_num * stimulus_num * channel_num * n_component)
+        or (trial_num * filterbank_num * stimulus_num * channel_num * n_component)
     V : ndarray
         Weights of harmonics
         shape: (filterbank_num * stimulus_num * harmonic_num * n_component)
+        or (trial_num * filterbank_num * stimulus_num * harmonic_num * n_component)
 
     Returns
     -------
     R : ndarray
         Correlation
         shape: (filterbank_num * stimulus_num)
+        or (trial_num * filterbank_num * stimulus_num)
     """
-    filterbank_num, channel_num, signal_len = X.shape
-    if len(Y[0].shape)==2:
-        harmonic_num = Y[0].shape[0]
-    elif len(Y[0].shape)==3:
-        harmonic_num = Y[0].shape[1]
+    return corrcoef_rows(_project_X_withU(X, U), _project_Y_withV(Y, V), overwrite_input = True)
+
+def _r_cca_canoncorr_withUV_trials(X: List[ndarray],
+                                   Y: List[ndarray],
+                                   U: ndarray,
+                                   V: ndarray,
+                                   block_bytes: int = 32 << 20) -> ndarray:
+    """
+    Calculate correlations of many trials by "_r_cca_canoncorr_withUV" in blocks of trials
+
+    Trials of a block are stacked and computed in one call. 
+    The number of trials in a block is decided by the size of projections of one trial, 
+    so that the memory does not grow with the number of trials.
+
+    Parameters
+    ----------
+    X : List[ndarray]
+        List of EEG data
+        EEG shape: (filterbank_num, channel_num, signal_len)
+    Y : List[ndarray]
+        Reference or template signals following "_r_cca_canoncorr_withUV"
+    U : ndarray
+        Spatial filter shared by all trials
+        shape: (filterbank_num * stimulus_num * channel_num * n_component)
+        or stacked filters of trials: (trial_num * filterbank_num * stimulus_num * channel_num * n_component)
+    V : ndarray
+        Weights of harmonics shared by all trials or stacked in the same way as U
+    block_bytes : int
+        Approximate memory size of projections of one block.
+        Default is 32 MB.
+
+    Returns
+    -------
+    R : ndarray
+        Correlation
+        shape: (trial_num * filterbank_num * stimulus_num)
+    """
+    trial_num = len(X)
+    filterbank_num, _, signal_len = X[0].shape
+    stimulus_num, _, n_component = U.shape[-3:]
+    trial_bytes = filterbank_num * stimulus_num * n_component * signal_len * np.result_type(X[0], U).itemsize
+    block_size = max(1, min(trial_num, block_bytes // max(1, trial_bytes)))
+    U_per_trial = U.ndim > X[0].ndim + 1
+    V_per_trial = V.ndim > X[0].ndim + 1
+    # signals shared by all blocks are stacked once
+    if not isinstance(Y, ndarray):
+        Y = np.stack(Y, axis = 0)
+    R = None
+    for start in range(0, trial_num, block_size):
+        stop = min(start + block_size, trial_num)
+        R_block = _r_cca_canoncorr_withUV(X = np.stack(X[start:stop]), Y = Y, 
+                                          U = U[start:stop] if U_per_trial else U, 
+                                          V = V[start:stop] if V_per_trial else V)
+        if R is None:
+            R = np.empty((trial_num,) + R_block.shape[1:], dtype = R_block.dtype)
+        R[start:stop] = R_block
+    return R
+
+def _project_X_withU(X: ndarray,
+                     U: ndarray) -> ndarray:
+    """
+    Project EEG data of all (trials,) filterbanks and stimuli by spatial filters at once
+
+    Shapes of X and U follow "_r_cca_canoncorr_withUV".
+
+    Returns
+    -------
+    a : ndarray
+        Flattened projections
+        shape: (... * stimulus_num * (n_component*signal_len))
+    """
+    # Filters of all stimuli are stacked as rows of one matrix for each filterbank,
+    # so that each filterbank is projected by a single matmul instead of one matmul per stimulus
+    *batch_shape, stimulus_num, channel_num, n_component = U.shape
+    U_T = np.ascontiguousarray(np.swapaxes(U, -1, -2))
+    U_T = np.reshape(U_T, tuple(batch_shape) + (stimulus_num * n_component, channel_num))
+    a = U_T @ X
+    return np.reshape(a, a.shape[:-2] + (stimulus_num, -1))
+
+def _project_Y_withV(Y: List[ndarray],
+                     V: ndarray) -> ndarray:
+    """
+    Project reference or template signals of all filterbanks and stimuli by V at once
+
+    Shapes of Y and V follow "_r_cca_canoncorr_withUV".
+
+    Returns
+    -------
+    b : ndarray
+        Flattened projections
+        shape: (... * stimulus_num * (n_component*signal_len))
+    """
+    if not isinstance(Y, ndarray):
+        Y = np.stack(Y, axis = 0)
+    if len(Y.shape)==3: # reference, shared by all filterbanks
+        Y = np.expand_dims(Y, axis = 0)
+    elif len(Y.shape)==4: # template
+        Y = np.transpose(Y, (1,0,2,3))
     else:
         raise ValueError('Unknown data type')
-    stimulus_num = len(Y)
-    
-    R = np.zeros((filterbank_num, stimulus_num))
-    
-    for k in range(filterbank_num):
-        tmp = X[k,:,:]
-        for i in range(stimulus_num):
-            if len(Y[i].shape)==2:
-                Y_tmp = Y[i]
-            elif len(Y[i].shape)==3:
-                Y_tmp = Y[i][k,:,:]
-            else:
-                raise ValueError('Unknown data type')
-            
-            A_r = U[k,i,:,:]
-            B_r = V[k,i,:,:]
-            
-            a = A_r.T @ tmp
-            b = B_r.T @ Y_tmp
-            a = np.reshape(a, (-1))
-            b = np.reshape(b, (-1))
-            
-            # r2 = stats.pearsonr(a, b)[0]
-            # r = stats.pearsonr(a, b)[0]
-            r = np.corrcoef(a, b)[0,1]
-            R[k,i] = r
-    return R
+    V_T = np.ascontiguousarray(np.swapaxes(V, -1, -2))
+    b = V_T @ Y
+    return np.reshape(b, b.shape[:-2] + (-1,))
 
 def _r_cca_qr_withUV(X: ndarray,
                   Y_Q: List[ndarray],
                   Y_R: List[ndarray],
                   Y_P: List[ndarray],
                   U: ndarray,
-                  V: ndarray) -> ndarray:
+                  V: ndarray,
+                  Y: Optional[List[ndarray]] = None) -> ndarray:
     """
     Calculate correlation of CCA based on qr decomposition for single trial data using existing U and V
 
+    Stacked trials are supported in the same way as "_r_cca_canoncorr_withUV".
+
     Parameters
     ----------
     X : ndarray
         Single trial EEG data
         EEG shape: (filterbank_num, channel_num, signal_len)
+        or stacked EEG data: (trial_num, filterbank_num, channel_num, signal_len)
     Y_Q : List[ndarray]
         Q of reference signals
     Y_R: List[ndarray]
@@ -219,6 +378,11 @@ def _r_cca_qr_withUV(X: ndarray,
     V : ndarray
         Weights of harmonics
         shape: (filterbank_num * stimulus_num * harmonic_num * n_component)
+    Y : Optional[List[ndarray]]
+        Reference signals reconstructed from Y_Q, Y_R and Y_P (means removed).
+        It can also be one stacked array, which is used as it is. 
+        Models store this stacked array in "fit" so that predictions do not reconstruct or stack references again.
+        If None, they will be reconstructed by "qr_inverse_list".
 
     Returns
     -------
@@ -226,44 +390,10 @@ def _r_cca_qr_withUV(X: ndarray,
         Correlation
         shape: (filterbank_num * stimulus_num)
     """
-    filterbank_num, channel_num, signal_len = X.shape
-    harmonic_num = Y_R[0].shape[-1]
-    stimulus_num = len(Y_Q)
-    
-    Y = [qr_inverse(Y_Q[i],Y_R[i],Y_P[i]) for i in range(len(Y_Q))]
-    if len(Y[0].shape)==2: # reference
-        Y = [Y_tmp.T for Y_tmp in Y]
-    elif len(Y[0].shape)==3: # template
-        Y = [np.transpose(Y_tmp, (0,2,1)) for Y_tmp in Y]
-    else:
-        raise ValueError('Unknown data type')
-    
-    R = np.zeros((filterbank_num, stimulus_num))
+    if Y is None:
+        Y = qr_inverse_list(Y_Q, Y_R, Y_P)
     
-    for k in range(filterbank_num):
-        tmp = X[k,:,:]
-        X_Q, X_R, X_P = qr_remove_mean(tmp.T)
-        for i in range(stimulus_num):
-            if len(Y[i].shape)==2:
-                Y_tmp = Y[i]
-            elif len(Y[i].shape)==3:
-                Y_tmp = Y[i][k,:,:]
-            else:
-                raise ValueError('Unknown data type')
-                
-            A_r = U[k,i,:,:]
-            B_r = V[k,i,:,:]
-            
-            a = A_r.T @ tmp
-            b = B_r.T @ Y_tmp
-            a = np.reshape(a, (-1))
-            b = np.reshape(b, (-1))
-            
-            # r2 = stats.pearsonr(a, b)[0]
-            # r = stats.pearsonr(a, b)[0]
-            r = np.corrcoef(a, b)[0,1]
-            R[k,i] = r
-    return R
+    return _r_cca_canoncorr_withUV(X, Y, U, V)
     
 def _r_cca_canoncorr(X: ndarray,
                      Y: List[ndarray],
@@ -296,59 +426,22 @@ def _r_cca_canoncorr(X: ndarray,
         Weights of harmonics
         shape: (filterbank_num * stimulus_num * harmonic_num * n_component)
     """
-    filterbank_num, channel_num, signal_len = X.shape
-    if len(Y[0].shape)==2:
-        harmonic_num = Y[0].shape[0]
-    elif len(Y[0].shape)==3:
-        harmonic_num = Y[0].shape[1]
-    else:
-        raise ValueError('Unknown data type')
-    stimulus_num = len(Y)
-    
-    # R1 = np.zeros((filterbank_num,stimulus_num))
-    # R2 = np.zeros((filterbank_num,stimulus_num))
-    R = np.zeros((filterbank_num, stimulus_num))
-    U = np.zeros((filterbank_num, stimulus_num, channel_num, n_component))
-    V = np.zeros((filterbank_num, stimulus_num, harmonic_num, n_component))
-    
-    for k in range(filterbank_num):
-        tmp = X[k,:,:]
-        for i in range(stimulus_num):
-            if len(Y[i].shape)==2:
-                Y_tmp = Y[i]
-            elif len(Y[i].shape)==3:
-                Y_tmp = Y[i][k,:,:]
-            else:
-                raise ValueError('Unknown data type')
-                
-            if n_component == 0 and force_output_UV is False:
-                D = canoncorr(tmp.T, Y_tmp.T, False)
-                r = D[0]
-            else:
-                A_r, B_r, D = canoncorr(tmp.T, Y_tmp.T, True)
-                
-                a = A_r[:channel_num, :n_component].T @ tmp
-                b = B_r[:harmonic_num, :n_component].T @ Y_tmp
-                a = np.reshape(a, (-1))
-                b = np.reshape(b, (-1))
-                
-                # r = stats.pearsonr(a, b)[0]
-                r = np.corrcoef(a, b)[0,1]
-                U[k,i,:,:] = A_r[:channel_num, :n_component]
-                V[k,i,:,:] = B_r[:harmonic_num, :n_component]
-                
-            R[k,i] = r
-    if force_output_UV:
-        return R, U, V
-    else:
-        return R
+    # QR decompositions of X and Y are computed once and shared by all stimuli and filterbanks,
+    # instead of being repeated inside every "canoncorr"
+    Y_Q, Y_R, Y_P = qr_list(Y)
+    return _r_cca_qr(X, Y_Q, Y_R, Y_P, n_component, force_output_UV, Y = Y)
 
 def _r_cca_qr(X: ndarray,
            Y_Q: List[ndarray],
            Y_R: List[ndarray],
            Y_P: List[ndarray],
            n_component: int,
-           force_output_UV: Optional[bool] = False) -> Union[ndarray, Tuple[ndarray, ndarray, ndarray]]:
+           force_output_UV: Optional[bool] = False,
+           Y: Optional[List[ndarray]] = None,
+           X_Q: Optional[ndarray] = None,
+           X_R: Optional[ndarray] = None,
+           X_P: Optional[ndarray] = None,
+           Y_R_pinv: Optional[List[ndarray]] = None) -> Union[ndarray, Tuple[ndarray, ndarray, ndarray]]:
     """
     Calculate correlation of CCA based on QR decomposition for single trial data 
 
@@ -367,6 +460,23 @@ def _r_cca_qr(X: ndarray,
         Number of eigvectors for spatial filters.
     force_output_UV : Optional[bool]
         Whether return spatial filter 'U' and weights of harmonics 'V'
+    Y : Optional[List[ndarray]]
+        Reference signals reconstructed from Y_Q, Y_R and Y_P (means removed).
+        If None, they will be reconstructed by "qr_inverse_list".
+    X_Q : Optional[ndarray]
+        Q of EEG data generated by "qr_list"
+        shape: (filterbank_num * signal_len * channel_num)
+        If None, QR decomposition of X will be computed.
+        Precomputed X_Q, X_R and X_P allow several calls on the same trial to share one QR decomposition,
+        e.g. r1 and r2 of eCCA.
+    X_R : Optional[ndarray]
+        R of EEG data generated by "qr_list"
+    X_P : Optional[ndarray]
+        P of EEG data generated by "qr_list"
+    Y_R_pinv : Optional[List[ndarray]]
+        Pseudo-inverse of Y_R generated by "pinv_list".
+        If None, it will be computed in this function.
+        References do not change across trials, so models can compute it once in "fit".
 
     Returns
     -------
@@ -384,71 +494,109 @@ def _r_cca_qr(X: ndarray,
     harmonic_num = Y_R[0].shape[-1]
     stimulus_num = len(Y_Q)
     
-    Y = [qr_inverse(Y_Q[i],Y_R[i],Y_P[i]) for i in range(len(Y_Q))]
-    if len(Y[0].shape)==2: # reference
-        Y = [Y_tmp.T for Y_tmp in Y]
-    elif len(Y[0].shape)==3: # template
-        Y = [np.transpose(Y_tmp, (0,2,1)) for Y_tmp in Y]
-    else:
-        raise ValueError('Unknown data type')
+    only_r = n_component == 0 and force_output_UV is False
+    if only_r:
+        # Filters are not required so that the column pivoting is not needed.
+        # QR decompositions of all filterbanks are computed in one batched call.
+        if X_Q is None:
+            X_Q = np.linalg.qr(np.swapaxes(X - np.mean(X, axis = -1, keepdims = True), -1, -2))[0]
+        # Only the largest canonical correlations are required, 
+        # which are obtained for all filterbanks and stimuli at once
+        if not isinstance(Y_Q, ndarray):
+            Y_Q = np.stack(Y_Q, axis = 0)
+        if len(Y_Q.shape)==3: # reference
+            Y_Q = np.expand_dims(Y_Q, axis = 0)
+        elif len(Y_Q.shape)==4: # template
+            Y_Q = np.swapaxes(Y_Q, 0, 1)
+        else:
+            raise ValueError('Unknown data type')
+        svd_X = np.expand_dims(np.swapaxes(X_Q, -1, -2), axis = 1) @ Y_Q
+        return max_singular_value(svd_X)
+    
+    if Y is None:
+        Y = qr_inverse_list(Y_Q, Y_R, Y_P)
     
     # R1 = np.zeros((filterbank_num,stimulus_num))
     # R2 = np.zeros((filterbank_num,stimulus_num))
-    R = np.zeros((filterbank_num, stimulus_num))
-    U = np.zeros((filterbank_num, stimulus_num, channel_num, n_component))
-    V = np.zeros((filterbank_num, stimulus_num, harmonic_num, n_component))
+    # follow the precision of inputs, e.g. float32 EEG data are kept in float32
+    dtype = np.result_type(X, Y_Q[0])
+    U = np.empty((filterbank_num, stimulus_num, channel_num, n_component), dtype = dtype)
+    V = np.empty((filterbank_num, stimulus_num, harmonic_num, n_component), dtype = dtype)
+    
+    # "mldivide" of R is replaced by its pseudo-inverse, which is invariant across trials and filterbanks
+    if Y_R_pinv is None:
+        Y_R_pinv = pinv_list(Y_R)
     
+    # Decide once whether Y holds references (shared by all filterbanks) or
+    # templates (one per filterbank) instead of checking every stimulus
+    # Q of equally shaped signals are stacked by "qr_list" (stimulus_num * ...),
+    # so that projections of all stimuli are computed by one batched matmul
+    Y_Q_stacked = isinstance(Y_Q, ndarray)
+    if len(Y_Q[0].shape)==2: # reference
+        Y_fb = [(Y_Q, Y_R_pinv, Y_P)] * filterbank_num
+    elif len(Y_Q[0].shape)==3: # template
+        Y_fb = [(Y_Q[:,k,:,:] if Y_Q_stacked else [y[k,:,:] for y in Y_Q], 
+                 [y[k,:,:] for y in Y_R_pinv], [y[k,:] for y in Y_P])
+                for k in range(filterbank_num)]
+    else:
+        raise ValueError('Unknown data type')
+    
+    # gesdd is faster, but the signs of its singular vectors can differ from gesvd (matlab).
+    # Signs do not change R, so gesdd is only used when the filters are not returned.
+    lapack_driver = 'gesvd' if force_output_UV else 'gesdd'
+    scale = np.sqrt(signal_len - 1)
     for k in range(filterbank_num):
         tmp = X[k,:,:]
-        X_Q, X_R, X_P = qr_remove_mean(tmp.T)
+        if X_Q is None:
+            X_Q_tmp, X_R_tmp, X_P_tmp = qr_remove_mean(tmp.T)
+        else:
+            X_Q_tmp = X_Q[k,:,:]
+            X_R_tmp = X_R[k,:,:]
+            X_P_tmp = X_P[k,:]
+        X_R_pinv_tmp = pinv(X_R_tmp)
+        Y_Q_k, Y_R_pinv_k, Y_P_k = Y_fb[k]
+        # Y_Q is used as it is stored by "qr_list". 
+        # X_Q_tmp.T is a transposed view, which is passed to BLAS as a transposed operand without copying, 
+        # so transposed copies of Q do not need to be stored.
+        if Y_Q_stacked:
+            # Only SVDs are left in the loop over stimuli. 
+            # Singular vectors are collected so that pseudo-inverses are applied 
+            # and column pivoting is undone for all stimuli at once.
+            # Pseudo-inverses are multiplied with all singular vectors before the leading components are taken, 
+            # in the same order as the loop below. 
+            # Otherwise rounding changes, which is amplified if R of X is nearly singular, e.g. in r3 of OACCA.
+            svd_X_k = X_Q_tmp.T @ Y_Q_k
+            full_matrices = svd_X_k.shape[-2] <= svd_X_k.shape[-1]
+            L_k, M_k = None, None
+            for i in range(stimulus_num):
+                L, _, M = svd(svd_X_k[i], full_matrices, True, overwrite_a = True, lapack_driver = lapack_driver)
+                if L_k is None:
+                    L_k = np.empty((stimulus_num,) + L.shape, dtype = L.dtype)
+                    M_k = np.empty((stimulus_num,) + M.shape, dtype = M.dtype)
+                L_k[i] = L
+                M_k[i] = M.T
+            U[k][:, X_P_tmp, :] = ((X_R_pinv_tmp @ L_k) * scale)[..., :n_component]
+            np.put_along_axis(V[k], np.expand_dims(np.asarray(Y_P_k), axis = -1), 
+                              ((np.stack(Y_R_pinv_k, axis = 0) @ M_k) * scale)[..., :n_component], axis = 1)
+            continue
+        svd_X_k = [X_Q_tmp.T @ Y_Q_tmp for Y_Q_tmp in Y_Q_k]
         for i in range(stimulus_num):
-            if len(Y_Q[i].shape)==2: # reference
-                Y_Q_tmp = Y_Q[i]
-                Y_R_tmp = Y_R[i]
-                Y_P_tmp = Y_P[i]
-                Y_tmp = Y[i]
-            elif len(Y_Q[i].shape)==3: # template
-                Y_Q_tmp = Y_Q[i][k,:,:]
-                Y_R_tmp = Y_R[i][k,:,:]
-                Y_P_tmp = Y_P[i][k,:]
-                Y_tmp = Y[i][k,:,:]
-            else:
-                raise ValueError('Unknown data type')
-            svd_X = X_Q.T @ Y_Q_tmp
+            Y_R_pinv_tmp = Y_R_pinv_k[i]
+            Y_P_tmp = Y_P_k[i]
+            svd_X = svd_X_k[i]
             if svd_X.shape[0]>svd_X.shape[1]:
                 full_matrices=False
             else:
                 full_matrices=True
-            
-            if n_component == 0 and force_output_UV is False:
-                D = svd(svd_X, full_matrices, False)
-                r = D[0]
-            else:
-                L, D, M = svd(svd_X, full_matrices, True)
-                M = M.T
-                A = mldivide(X_R, L) * np.sqrt(signal_len - 1)
-                B = mldivide(Y_R_tmp, M) * np.sqrt(signal_len - 1)
-                A_r = np.zeros(A.shape)
-                for n in range(A.shape[0]):
-                    A_r[X_P[n],:] = A[n,:]
-                B_r = np.zeros(B.shape)
-                for n in range(B.shape[0]):
-                    B_r[Y_P_tmp[n],:] = B[n,:]
-                
-                a = A_r[:channel_num, :n_component].T @ tmp
-                b = B_r[:harmonic_num, :n_component].T @ Y_tmp
-                a = np.reshape(a, (-1))
-                b = np.reshape(b, (-1))
-                
-                # r2 = stats.pearsonr(a, b)[0]
-                # r = stats.pearsonr(a, b)[0]
-                r = np.corrcoef(a, b)[0,1]
-                U[k,i,:,:] = A_r[:channel_num, :n_component]
-                V[k,i,:,:] = B_r[:harmonic_num, :n_component]
-                
-            # R1[k,i] = r1
-            # R2[k,i] = r2
-            R[k,i] = r
+            L, D, M = svd(svd_X, full_matrices, True, overwrite_a = True, lapack_driver = lapack_driver)
+            M = M.T
+            A = (X_R_pinv_tmp @ L) * scale
+            B = (Y_R_pinv_tmp @ M) * scale
+            # undo column pivoting while writing the leading components into U and V
+            U[k,i,X_P_tmp,:] = A[:, :n_component]
+            V[k,i,Y_P_tmp,:] = B[:, :n_component]
+    # project and correlate all filterbanks and stimuli at once
+    R = _r_cca_canoncorr_withUV(X, Y, U, V)
     if force_output_UV:
         return R, U, V
     else:
@@ -551,13 +699,14 @@ class MsetCCA(BaseModel):
 
         separated_trainSig = separate_trainSig(X, Y)
 
-        if self.n_jobs is not None:
-            U_all_stimuli, template_all_stimuli = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(_msetcca_cal_template_U, I = np.eye(X[0].shape[-1])))(a) for a in separated_trainSig))
+        if self._use_parallel():
+            worker = delayed(partial(_msetcca_cal_template_U, I = np.eye(X[0].shape[-1], dtype = X[0].dtype)))
+            U_all_stimuli, template_all_stimuli = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in separated_trainSig))
         else:
             U_all_stimuli = []
             template_all_stimuli = []
             for a in separated_trainSig:
-                U_temp, template_temp = _msetcca_cal_template_U(a, I = np.eye(X[0].shape[-1]))
+                U_temp, template_temp = _msetcca_cal_template_U(a, I = np.eye(X[0].shape[-1], dtype = X[0].dtype))
                 U_all_stimuli.append(U_temp)
                 template_all_stimuli.append(template_temp)
 
@@ -568,38 +717,32 @@ class MsetCCA(BaseModel):
         self.model['template_sig_Q'] = template_sig_Q # List of shape: (stimulus_num,);
         self.model['template_sig_R'] = template_sig_R
         self.model['template_sig_P'] = template_sig_P
+        self.model['template_sig_R_pinv'] = pinv_list(template_sig_R)
+        self.model['template_sig_remove_mean'] = np.stack(qr_inverse_list(template_sig_Q, template_sig_R, template_sig_P), axis = 0)
             
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
         
         template_sig_Q = self.model['template_sig_Q'] 
         template_sig_R = self.model['template_sig_R'] 
         template_sig_P = self.model['template_sig_P'] 
+        template_sig_R_pinv = self.model['template_sig_R_pinv']
+        template_sig = self.model['template_sig_remove_mean']
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr, n_component=self.n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, force_output_UV=False))(a) for a in X)
+        if self._use_parallel() and len(X) > 1:
+            worker = delayed(partial(_r_cca_qr, n_component=self.n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, Y_R_pinv=template_sig_R_pinv, Y=template_sig, force_output_UV=False))
+            r = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in X)
         else:
             r = []
             for a in X:
                 r.append(
-                    _r_cca_qr(a, n_component=self.n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, force_output_UV=False)
+                    _r_cca_qr(a, n_component=self.n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, Y_R_pinv=template_sig_R_pinv, Y=template_sig, force_output_UV=False)
                 )
         # self.model['U'] = U
         # self.model['U_template'] = V
 
-        Y_pred = [int(np.argmax(weights_filterbank @ r_single, axis = 1)) for r_single in r]
+        Y_pred = np.argmax(weights_filterbank @ np.stack(r), axis = -1)[:,0].tolist()
         
         return Y_pred, r
 
@@ -656,10 +799,10 @@ class MsetCCAwithR(BaseModel):
         
 
         separated_trainSig = separate_trainSig(X, Y)
-        ref_sig_Q, ref_sig_R, ref_sig_P = qr_list(ref_sig)
+        ref_sig_Q, _, _ = qr_list(ref_sig, pivoting = False)
 
-        if self.n_jobs is not None:
-            U_all_stimuli, template_all_stimuli = zip(*Parallel(n_jobs=self.n_jobs)(delayed(_msetcca_cal_template_U)(X_single_stimulus = a, I = Q @ Q.T) for a, Q in zip(separated_trainSig, ref_sig_Q)))
+        if self._use_parallel():
+            U_all_stimuli, template_all_stimuli = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_msetcca_cal_template_U)(X_single_stimulus = a, I = Q @ Q.T) for a, Q in zip(separated_trainSig, ref_sig_Q)))
         else:
             U_all_stimuli = []
             template_all_stimuli = []
@@ -675,38 +818,32 @@ class MsetCCAwithR(BaseModel):
         self.model['template_sig_Q'] = template_sig_Q # List of shape: (stimulus_num,);
         self.model['template_sig_R'] = template_sig_R
         self.model['template_sig_P'] = template_sig_P
+        self.model['template_sig_R_pinv'] = pinv_list(template_sig_R)
+        self.model['template_sig_remove_mean'] = np.stack(qr_inverse_list(template_sig_Q, template_sig_R, template_sig_P), axis = 0)
             
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
         
         template_sig_Q = self.model['template_sig_Q'] 
         template_sig_R = self.model['template_sig_R'] 
         template_sig_P = self.model['template_sig_P'] 
+        template_sig_R_pinv = self.model['template_sig_R_pinv']
+        template_sig = self.model['template_sig_remove_mean']
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr, n_component=self.n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, force_output_UV=False))(a) for a in X)
+        if self._use_parallel() and len(X) > 1:
+            worker = delayed(partial(_r_cca_qr, n_component=self.n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, Y_R_pinv=template_sig_R_pinv, Y=template_sig, force_output_UV=False))
+            r = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in X)
         else:
             r = []
             for a in X:
                 r.append(
-                    _r_cca_qr(a, n_component=self.n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, force_output_UV=False)
+                    _r_cca_qr(a, n_component=self.n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, Y_R_pinv=template_sig_R_pinv, Y=template_sig, force_output_UV=False)
                 )
         # self.model['U'] = U
         # self.model['U_template'] = V
 
-        Y_pred = [int(np.argmax(weights_filterbank @ r_single, axis = 1)) for r_single in r]
+        Y_pred = np.argmax(weights_filterbank @ np.stack(r), axis = -1)[:,0].tolist()
         
         return Y_pred, r
 
@@ -754,125 +891,102 @@ class OACCA(BaseModel):
 
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         n_component = self.n_component
         Y = self.model['ref_sig']
         stimulus_num = len(Y)
         harmonic_num, _ = Y[0].shape
+        # reference signals do not change over trials, 
+        # so their QR decompositions and stacked array are prepared once
+        Y_Q, Y_R, Y_P = qr_list(Y)
+        Y_R_pinv = pinv_list(Y_R)
+        Y_stack = np.stack(Y, axis = 0)
+        # transposed references used to update Cxy: (stimulus_num * signal_len * harmonic_num)
+        Y_stack_T = np.ascontiguousarray(np.swapaxes(Y_stack, -1, -2))
         # Calculate Res
         Y_pred = []
         r_pred = []
         for x_single_trial in X:
             filterbank_num, channel_num, signal_len = x_single_trial.shape
             # Calculate res of this step
-            cca_r, cca_sfx, cca_sfy = _r_cca_canoncorr(x_single_trial,Y,n_component,True) # cca_sfx: (filterbank_num * stimulus_num * channel_num * n_component)
+            cca_r, cca_sfx, cca_sfy = _r_cca_qr(x_single_trial,Y_Q,Y_R,Y_P,n_component,True,Y=Y,Y_R_pinv=Y_R_pinv) # cca_sfx: (filterbank_num * stimulus_num * channel_num * n_component)
             if (self.model['U'] is not None) and (self.model['V'] is not None):
-                r2 = _r_cca_canoncorr_withUV(x_single_trial,Y,self.model['U'],self.model['V'])
+                r2 = _r_cca_canoncorr_withUV(x_single_trial,Y_stack,self.model['U'],self.model['V'])
             else:
                 r2 = 0
             if self.model['U0'] is not None:
-                x_single_trial_filtered = deepcopy(x_single_trial)
-                for k in range(filterbank_num):
-                    x_single_trial_filtered[k,:,:] = self.model['U0'][k,0,:,:].T @ x_single_trial_filtered[k,:,:]
-                r3 = _r_cca_canoncorr(x_single_trial_filtered,Y,n_component,False)
+                # The filtered signal of each filterbank is repeated for all channels, 
+                # which keeps the shape of EEG data
+                x_single_trial_filtered = np.swapaxes(self.model['U0'][:,0,:,:], -1, -2) @ x_single_trial
+                x_single_trial_filtered = np.repeat(x_single_trial_filtered, channel_num, axis = 1)
+                r3 = _r_cca_qr(x_single_trial_filtered,Y_Q,Y_R,Y_P,n_component,False,Y=Y,Y_R_pinv=Y_R_pinv)
             else:
                 r3 = 0
-            oacca_res = int( np.argmax( weights_filterbank @ (cca_r + 
-                                                                r2 +
-                                                                r3)))
-            cca_res = int( np.argmax( weights_filterbank @ cca_r))
-            prototype_res = int( np.argmax( weights_filterbank @ (cca_r +
-                                                                    r3)))
+            # combined correlations are computed once and all three results are weighted in one matmul
+            oacca_r = cca_r + r2 + r3
+            prototype_r = cca_r + r3
+            oacca_res, cca_res, prototype_res = np.argmax(weights_filterbank @ np.stack((oacca_r, cca_r, prototype_r)), axis = -1)[:,0].tolist()
             # print([oacca_res, cca_res, prototype_res])
             # print(x_single_trial.shape)
             # raise ValueError
             Y_pred.append(oacca_res)
-            r_pred.append(cca_r + r2 + r3)
+            r_pred.append(oacca_r)
             # Update parameters
+            #   Filterbanks are stored along the first axis so that their matrices are contiguous 
+            #   and updated by batched matmul
+            #   covar_mat: (filterbank_num * channel_num * channel_num)
+            #   Cxx: (filterbank_num * channel_num * channel_num)
+            #   Cxy: (filterbank_num * channel_num * harmonic_num)
             if self.model['covar_mat'] is None:
-                self.model['covar_mat'] = np.zeros((channel_num, channel_num, filterbank_num))
-                self.model['Cxx'] = np.zeros((channel_num, channel_num, filterbank_num))
-                self.model['Cxy'] = np.zeros((channel_num, harmonic_num, filterbank_num))
+                self.model['covar_mat'] = np.zeros((filterbank_num, channel_num, channel_num), dtype = x_single_trial.dtype)
+                self.model['Cxx'] = np.zeros((filterbank_num, channel_num, channel_num), dtype = x_single_trial.dtype)
+                self.model['Cxy'] = np.zeros((filterbank_num, channel_num, harmonic_num), dtype = x_single_trial.dtype)
             # Calculate prototype
-            if cca_res == oacca_res:
-                # if self.model['U0'] is None:
-                #     self.model['U0'] = np.zeros((filterbank_num, stimulus_num, channel_num, n_component))
-                sf1x_list = [cca_sfx[k,cca_res,:,:] for k in range(filterbank_num)]
-                old_covar_mat_list = [self.model['covar_mat'][:,:,k] for k in range(filterbank_num)]
-
-                if self.n_jobs is not None:
-                    u0_list, new_covar_mat_list = zip(*Parallel(n_jobs=self.n_jobs)(delayed(_oacca_cal_u0)(sf1x = sf1x, old_covar_mat = old_covar_mat) for sf1x, old_covar_mat in zip(sf1x_list, old_covar_mat_list)))
-                else:
-                    u0_list = []
-                    new_covar_mat_list = []
-                    for sf1x, old_covar_mat in zip(sf1x_list, old_covar_mat_list):
-                        u0_temp, new_covar_mat_temp = _oacca_cal_u0(sf1x = sf1x, old_covar_mat = old_covar_mat)
-                        u0_list.append(u0_temp)
-                        new_covar_mat_list.append(new_covar_mat_temp)
-
-                self.model['covar_mat'] = np.concatenate([np.expand_dims(covar_mat, axis = 2) for covar_mat in new_covar_mat_list], axis = 2)
-                u0 = np.concatenate([np.expand_dims(tmp, axis = 0) for tmp in u0_list], axis = 0)
-                u0 = np.expand_dims(u0, axis = 1)
-                u0 = np.repeat(u0, stimulus_num, axis = 1)
-                u0 = np.expand_dims(u0, axis = 3)
-                self.model['U0'] = u0
-                # for k, u0 in enumerate(u0_list):
-                #     for class_i in range(stimulus_num):
-                #         self.model['U0'][k,class_i,:,0] = u0
-                    # self.model['covar_mat'][:,:,k] = new_covar_mat_list[k]
+            update_u0 = cca_res == oacca_res
+            if update_u0:
+                sf1x = cca_sfx[:,cca_res,:,:]
+                # norms are computed for each filterbank as before because the prototype filter is sensitive to rounding
+                sf1x = np.stack([sf/np.linalg.norm(sf) for sf in sf1x])
+                self.model['covar_mat'] = self.model['covar_mat'] + sf1x @ np.swapaxes(sf1x, -1, -2)
+                covar_mat_list = list(self.model['covar_mat'])
+            else:
+                covar_mat_list = [None] * filterbank_num
             # Calculate multi-stimulus 
-            # if self.model['U'] is None:
-            #     self.model['U'] = np.zeros((filterbank_num, stimulus_num, channel_num, n_component))
-            # if self.model['V'] is None:
-            #     self.model['V'] = np.zeros((filterbank_num, stimulus_num, harmonic_num, n_component))
-            filteredData_list = [x_single_trial[k,:,:] for k in range(filterbank_num)]
-            old_Cxx_list = [self.model['Cxx'][:,:,k] for k in range(filterbank_num)]
-            old_Cxy_list = [self.model['Cxy'][:,:,k] for k in range(filterbank_num)]
-
-            if self.n_jobs is not None:
-                u1_list, v1_list, new_Cxx_list, new_Cxy_list = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(_oacca_cal_u1_v1, sinTemplate = Y[prototype_res][:,:signal_len]))(filteredData = filteredData, old_Cxx = old_Cxx, old_Cxy = old_Cxy) for filteredData, old_Cxx, old_Cxy in zip(filteredData_list, old_Cxx_list, old_Cxy_list)))
+            sinTemplate_T = Y_stack_T[prototype_res,:signal_len,:]
+            self.model['Cxx'] = self.model['Cxx'] + x_single_trial @ np.swapaxes(x_single_trial, -1, -2)
+            self.model['Cxy'] = self.model['Cxy'] + x_single_trial @ sinTemplate_T
+
+            # filters of all filterbanks are updated in one parallel call
+            if self._use_parallel():
+                u0_list, u1_list, v1_list = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_oacca_cal_filters)(covar_mat = covar_mat, Cxx = Cxx, Cxy = Cxy) 
+                                                                                                   for covar_mat, Cxx, Cxy in zip(covar_mat_list, self.model['Cxx'], self.model['Cxy'])))
             else:
+                u0_list = []
                 u1_list = []
                 v1_list = []
-                new_Cxx_list = []
-                new_Cxy_list = []
-                for filteredData, old_Cxx, old_Cxy in zip(filteredData_list, old_Cxx_list, old_Cxy_list):
-                    u1_temp, v1_temp, new_Cxx_temp, new_Cxy_temp = _oacca_cal_u1_v1(filteredData = filteredData, old_Cxx = old_Cxx, old_Cxy = old_Cxy, sinTemplate = Y[prototype_res][:,:signal_len])
+                for covar_mat, Cxx, Cxy in zip(covar_mat_list, self.model['Cxx'], self.model['Cxy']):
+                    u0_temp, u1_temp, v1_temp = _oacca_cal_filters(covar_mat = covar_mat, Cxx = Cxx, Cxy = Cxy)
+                    u0_list.append(u0_temp)
                     u1_list.append(u1_temp)
                     v1_list.append(v1_temp)
-                    new_Cxx_list.append(new_Cxx_temp)
-                    new_Cxy_list.append(new_Cxy_temp)
 
-            self.model['Cxx'] = np.concatenate([np.expand_dims(Cxx, axis = 2) for Cxx in new_Cxx_list], axis = 2)
-            self.model['Cxy'] = np.concatenate([np.expand_dims(Cxy, axis = 2) for Cxy in new_Cxy_list], axis = 2)
-            u1 = np.concatenate([np.expand_dims(tmp, axis = 0) for tmp in u1_list], axis = 0)
+            if update_u0:
+                u0 = np.stack(u0_list, axis = 0)
+                u0 = np.expand_dims(u0, axis = 1)
+                u0 = np.repeat(u0, stimulus_num, axis = 1)
+                u0 = np.expand_dims(u0, axis = 3)
+                self.model['U0'] = u0
+            u1 = np.stack(u1_list, axis = 0)
             u1 = np.expand_dims(u1, axis = 1)
             u1 = np.repeat(u1, stimulus_num, axis = 1)
             u1 = np.expand_dims(u1, axis = 3)
             self.model['U'] = u1
-            v1 = np.concatenate([np.expand_dims(tmp, axis = 0) for tmp in v1_list], axis = 0)
+            v1 = np.stack(v1_list, axis = 0)
             v1 = np.expand_dims(v1, axis = 1)
             v1 = np.repeat(v1, stimulus_num, axis = 1)
             v1 = np.expand_dims(v1, axis = 3)
             self.model['V'] = v1
-            # for k, u1 in enumerate(u1_list):
-            #     for class_i in range(stimulus_num):
-            #         self.model['U'][k,class_i,:,0] = u1
-            #         self.model['V'][k,class_i,:,0] = v1_list[k]
-                # self.model['Cxx'][:,:,k] = new_Cxx_list[k]
-                # self.model['Cxy'][:,:,k] = new_Cxy_list[k]
                     
                 
         return Y_pred, r_pred
@@ -940,60 +1054,50 @@ class SCCA_canoncorr(BaseModel):
         
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
         n_component = self.n_component
         Y = self.model['ref_sig']
         force_output_UV = self.force_output_UV
         update_UV = self.update_UV
         
         if update_UV or self.model['U'] is None or self.model['V'] is None:
+            # References are transposed, decomposed and stacked once per call and shared by all trials,
+            # instead of being prepared again in "_r_cca_canoncorr" for every trial.
+            # They are not stored in the model to keep its memory small.
+            Y_Q, Y_R, Y_P = qr_list(Y)
+            Y_R_pinv = pinv_list(Y_R)
+            Y = np.stack(Y, axis = 0)
             if force_output_UV or not update_UV:
-                if self.n_jobs is not None:
-                    r, U, V = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr, n_component=n_component, Y=Y, force_output_UV=True))(a) for a in X))
+                if self._use_parallel() and len(X) > 1:
+                    worker = delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=True))
+                    r, U, V = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in X))
                 else:
                     r = []
                     U = []
                     V = []
                     for a in X:
-                        r_temp, U_temp, V_temp = _r_cca_canoncorr(a, n_component=n_component, Y=Y, force_output_UV=True)
+                        r_temp, U_temp, V_temp = _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=True)
                         r.append(r_temp)
                         U.append(U_temp)
                         V.append(V_temp)
                 self.model['U'] = U
                 self.model['V'] = V
             else:
-                if self.n_jobs is not None:
-                    r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr, n_component=n_component, Y=Y, force_output_UV=False))(a) for a in X)
+                if self._use_parallel() and len(X) > 1:
+                    worker = delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=False))
+                    r = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in X)
                 else:
                     r = []
                     for a in X:
                         r.append(
-                            _r_cca_canoncorr(a, n_component=n_component, Y=Y, force_output_UV=False)
+                            _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=False)
                         )
         else:
             U = self.model['U']
             V = self.model['V']
-            if self.n_jobs is not None:
-                r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=Y))(X=a, U=u, V=v) for a, u, v in zip(X,U,V))
-            else:
-                r = []
-                for a, u, v in zip(X,U,V):
-                    r.append(
-                        _r_cca_canoncorr_withUV(X=a, U=u, V=v, Y=Y)
-                    )
+            r = list(_r_cca_canoncorr_withUV_trials(X=X, U=_stack_trial_filters(U, len(X)), V=_stack_trial_filters(V, len(X)), Y=Y))
         
-        Y_pred = [int(np.argmax(weights_filterbank @ r_single, axis = 1)) for r_single in r]
+        Y_pred = np.argmax(weights_filterbank @ np.stack(r), axis = -1)[:,0].tolist()
         
         return Y_pred, r
      
@@ -1059,65 +1163,53 @@ class SCCA_qr(BaseModel):
         self.model['ref_sig_Q'] = ref_sig_Q
         self.model['ref_sig_R'] = ref_sig_R
         self.model['ref_sig_P'] = ref_sig_P
+        self.model['ref_sig_R_pinv'] = pinv_list(ref_sig_R)
+        self.model['ref_sig_remove_mean'] = np.stack(qr_inverse_list(ref_sig_Q, ref_sig_R, ref_sig_P), axis = 0)
         
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
         n_component = self.n_component
         Y_Q = self.model['ref_sig_Q']
         Y_R = self.model['ref_sig_R']
         Y_P = self.model['ref_sig_P']
+        Y_R_pinv = self.model['ref_sig_R_pinv']
+        Y = self.model['ref_sig_remove_mean']
         force_output_UV = self.force_output_UV
         update_UV = self.update_UV
         
         if update_UV or self.model['U'] is None or self.model['V'] is None:
             if force_output_UV or not update_UV:
-                if self.n_jobs is not None:
-                    r, U, V = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, force_output_UV=True))(a) for a in X))
+                if self._use_parallel() and len(X) > 1:
+                    worker = delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=True))
+                    r, U, V = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in X))
                 else:
                     r = []
                     U = []
                     V = []
                     for a in X:
-                        r_temp, U_temp, V_temp = _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, force_output_UV=True)
+                        r_temp, U_temp, V_temp = _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=True)
                         r.append(r_temp)
                         U.append(U_temp)
                         V.append(V_temp)
                 self.model['U'] = U
                 self.model['V'] = V
             else:
-                if self.n_jobs is not None:
-                    r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, force_output_UV=False))(a) for a in X)
+                if self._use_parallel() and len(X) > 1:
+                    worker = delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=False))
+                    r = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in X)
                 else:
                     r = []
                     for a in X:
                         r.append(
-                            _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, force_output_UV=False)
+                            _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=False)
                         )
         else:
             U = self.model['U']
             V = self.model['V']
-            if self.n_jobs is not None:
-                r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr_withUV, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P))(X=a, U=u, V=v) for a, u, v in zip(X,U,V))
-            else:
-                r = []
-                for a, u, v in zip(X,U,V):
-                    r.append(
-                        _r_cca_qr_withUV(X=a, U=u, V=v, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P)
-                    )
+            r = list(_r_cca_canoncorr_withUV_trials(X=X, U=_stack_trial_filters(U, len(X)), V=_stack_trial_filters(V, len(X)), Y=Y))
         
-        Y_pred = [int(np.argmax(weights_filterbank @ r_single, axis = 1)) for r_single in r]
+        Y_pred = np.argmax(weights_filterbank @ np.stack(r), axis = -1)[:,0].tolist()
         
         return Y_pred, r
     
@@ -1177,66 +1269,54 @@ class ITCCA(BaseModel):
         self.model['template_sig_Q'] = template_sig_Q # List of shape: (stimulus_num,);
         self.model['template_sig_R'] = template_sig_R
         self.model['template_sig_P'] = template_sig_P
+        self.model['template_sig_R_pinv'] = pinv_list(template_sig_R)
+        self.model['template_sig_remove_mean'] = np.stack(qr_inverse_list(template_sig_Q, template_sig_R, template_sig_P), axis = 0)
 
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
             
         n_component = self.n_component
         Y_Q = self.model['template_sig_Q']
         Y_R = self.model['template_sig_R']
         Y_P = self.model['template_sig_P']
+        Y_R_pinv = self.model['template_sig_R_pinv']
+        Y = self.model['template_sig_remove_mean']
         force_output_UV = self.force_output_UV
         update_UV = self.update_UV
         
         if update_UV or self.model['U'] is None or self.model['V'] is None:
             if force_output_UV or not update_UV:
-                if self.n_jobs is not None:
-                    r, U, V = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, force_output_UV=True))(a) for a in X))
+                if self._use_parallel() and len(X) > 1:
+                    worker = delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=True))
+                    r, U, V = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in X))
                 else:
                     r = []
                     U = []
                     V = []
                     for a in X:
-                        r_temp, U_temp, V_temp = _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, force_output_UV=True)
+                        r_temp, U_temp, V_temp = _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=True)
                         r.append(r_temp)
                         U.append(U_temp)
                         V.append(V_temp)
                 self.model['U'] = U
                 self.model['V'] = V
             else:
-                if self.n_jobs is not None:
-                    r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, force_output_UV=False))(a) for a in X)
+                if self._use_parallel() and len(X) > 1:
+                    worker = delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=False))
+                    r = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(a) for a in X)
                 else:
                     r = []
                     for a in X:
                         r.append(
-                            _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, force_output_UV=False)
+                            _r_cca_qr(a, n_component=n_component, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P, Y_R_pinv=Y_R_pinv, Y=Y, force_output_UV=False)
                         )
         else:
             U = self.model['U']
             V = self.model['V']
-            if self.n_jobs is not None:
-                r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr_withUV, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P))(X=a, U=u, V=v) for a, u, v in zip(X,U,V))
-            else:
-                r = []
-                for a, u, v in zip(X,U,V):
-                    r.append(
-                        _r_cca_qr_withUV(X=a, U=u, V=v, Y_Q=Y_Q, Y_R=Y_R, Y_P=Y_P)
-                    )
+            r = list(_r_cca_canoncorr_withUV_trials(X=X, U=_stack_trial_filters(U, len(X)), V=_stack_trial_filters(V, len(X)), Y=Y))
         
-        Y_pred = [int(np.argmax(weights_filterbank @ r_single, axis = 1)) for r_single in r]
+        Y_pred = np.argmax(weights_filterbank @ np.stack(r), axis = -1)[:,0].tolist()
         
         return Y_pred, r
 
@@ -1275,6 +1355,7 @@ class ECCA(BaseModel):
         
         self.model['U3'] = None
         self.model['V3'] = None
+        self.model['template_sig_proj_U3'] = None
         
     def __copy__(self):
         copy_model = ECCA(n_component = self.n_component,
@@ -1317,6 +1398,8 @@ class ECCA(BaseModel):
         self.model['ref_sig_Q'] = ref_sig_Q # List of shape: (stimulus_num,);
         self.model['ref_sig_R'] = ref_sig_R
         self.model['ref_sig_P'] = ref_sig_P
+        self.model['ref_sig_R_pinv'] = pinv_list(ref_sig_R)
+        self.model['ref_sig_remove_mean'] = np.stack(qr_inverse_list(ref_sig_Q, ref_sig_R, ref_sig_P), axis = 0)
         
         # generate template related QR
         template_sig = gen_template(X, Y) # List of shape: (stimulus_num,); 
@@ -1325,136 +1408,126 @@ class ECCA(BaseModel):
         self.model['template_sig_Q'] = template_sig_Q # List of shape: (stimulus_num,);
         self.model['template_sig_R'] = template_sig_R
         self.model['template_sig_P'] = template_sig_P
+        self.model['template_sig_R_pinv'] = pinv_list(template_sig_R)
+        self.model['template_sig_remove_mean'] = np.stack(qr_inverse_list(template_sig_Q, template_sig_R, template_sig_P), axis = 0)
         
         # spatial filters of template and reference: U3 and V3
         #   U3: (filterbank_num * stimulus_num * channel_num * n_component)
         #   V3: (filterbank_num * stimulus_num * harmonic_num * n_component)
-        filterbank_num = template_sig[0].shape[0]
-        stimulus_num = len(template_sig)
+        n_component = self.n_component
         channel_num = template_sig[0].shape[1]
         harmonic_num = ref_sig[0].shape[0]
-        n_component = self.n_component
-        U3 = np.zeros((filterbank_num, stimulus_num, channel_num, n_component))
-        V3 = np.zeros((filterbank_num, stimulus_num, harmonic_num, n_component))
-        for filterbank_idx in range(filterbank_num):
-            if self.n_jobs is not None:
-                U, V, _ = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(canoncorr, force_output_UV = True))(X=template_sig_single[filterbank_idx,:,:].T, 
-                                                                                                                Y=ref_sig_single.T) 
-                                                            for template_sig_single, ref_sig_single in zip(template_sig,ref_sig)))
-            else:
-                U = []
-                V = []
-                for template_sig_single, ref_sig_single in zip(template_sig,ref_sig):
-                    U_temp, V_temp, _ = canoncorr(X=template_sig_single[filterbank_idx,:,:].T, Y=ref_sig_single.T, force_output_UV = True)
-                    U.append(U_temp)
-                    V.append(V_temp)
-            for stim_idx, (u, v) in enumerate(zip(U,V)):
-                U3[filterbank_idx, stim_idx, :, :] = u[:channel_num,:n_component]
-                V3[filterbank_idx, stim_idx, :, :] = v[:harmonic_num,:n_component]
+        signal_len = ref_sig[0].shape[1]
+        # QR decompositions of references and templates computed above are reused,
+        # and pseudo-inverses of all stimuli and filterbanks are applied in batched matmuls
+        #   template: (stimulus_num * filterbank_num * ...)
+        #   reference: (stimulus_num * 1 * ...)
+        X_Q = np.stack(template_sig_Q, axis = 0)
+        X_R_pinv = np.stack(self.model['template_sig_R_pinv'], axis = 0)
+        X_P = np.stack(template_sig_P, axis = 0)
+        Y_Q = np.expand_dims(np.stack(ref_sig_Q, axis = 0), axis = 1)
+        Y_R_pinv = np.expand_dims(np.stack(self.model['ref_sig_R_pinv'], axis = 0), axis = 1)
+        Y_P = np.expand_dims(np.stack(ref_sig_P, axis = 0), axis = 1)
+        svd_X = np.swapaxes(X_Q, -1, -2) @ Y_Q
+        # Filters are returned, so singular vectors of each pair are computed by gesvd as "canoncorr",
+        # and signs of filters follow matlab
+        full_matrices = svd_X.shape[-2] <= svd_X.shape[-1]
+        L, M = None, None
+        for idx in np.ndindex(*svd_X.shape[:-2]):
+            L_tmp, _, M_tmp = svd(svd_X[idx], full_matrices, True, overwrite_a = True)
+            if L is None:
+                L = np.empty(svd_X.shape[:-2] + L_tmp.shape, dtype = L_tmp.dtype)
+                M = np.empty(svd_X.shape[:-2] + M_tmp.shape, dtype = M_tmp.dtype)
+            L[idx], M[idx] = L_tmp, M_tmp
+        # only leading components are kept in filters
+        M = np.swapaxes(M[..., :n_component, :], -1, -2)
+        A = (X_R_pinv @ L[..., :n_component]) * np.sqrt(signal_len - 1)
+        B = (Y_R_pinv @ M) * np.sqrt(signal_len - 1)
+        # Filters are stored as contiguous arrays (filterbank_num * stimulus_num * ...).
+        # Column pivoting is undone by writing A and B into swapped views of U3 and V3, 
+        # so that no intermediate arrays are needed.
+        U3 = np.empty((A.shape[1], A.shape[0], channel_num, A.shape[-1]), dtype = A.dtype)
+        np.put_along_axis(np.swapaxes(U3, 0, 1), np.expand_dims(X_P, axis = -1), A, axis = -2)
+        V3 = np.empty((B.shape[1], B.shape[0], harmonic_num, B.shape[-1]), dtype = B.dtype)
+        np.put_along_axis(np.swapaxes(V3, 0, 1), np.expand_dims(np.broadcast_to(Y_P, B.shape[:-2] + (Y_P.shape[-1],)), axis = -1), B, axis = -2)
         self.model['U3'] = U3
         self.model['V3'] = V3
+        # U3 is shared by all trials, so the projection of templates for r4 does not change between trials.
+        # It is normalized once here so that "predict" only needs dot products.
+        self.model['template_sig_proj_U3'] = normalize_rows(_project_Y_withV(self.model['template_sig_remove_mean'], U3))
+        # validate weights of filterbanks once the number of filterbanks is known
+        self.get_weights_filterbank(filterbank_num = template_sig[0].shape[0])
             
         
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
         n_component = self.n_component
         update_UV = self.update_UV
         
         ref_sig_Q = self.model['ref_sig_Q']
         ref_sig_R = self.model['ref_sig_R']
         ref_sig_P = self.model['ref_sig_P']
+        ref_sig_R_pinv = self.model['ref_sig_R_pinv']
+        ref_sig = self.model['ref_sig_remove_mean']
         
         template_sig_Q = self.model['template_sig_Q'] 
         template_sig_R = self.model['template_sig_R'] 
         template_sig_P = self.model['template_sig_P'] 
+        template_sig_R_pinv = self.model['template_sig_R_pinv']
+        template_sig = self.model['template_sig_remove_mean']
         
         U3 = self.model['U3'] 
         V3 = self.model['V3'] 
         
-        # r1
-        if update_UV or self.model['U1'] is None or self.model['V1'] is None:
-            if self.n_jobs is not None:
-                r1, U1, V1 = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=ref_sig_Q, Y_R=ref_sig_R, Y_P=ref_sig_P, force_output_UV=True))(a) for a in X))
+        # trials are stacked once and shared by all correlations computed with existing filters
+        X_stack = np.stack(X)
+        
+        # r1 and U2 of each trial are calculated in one task, sharing the QR decomposition of X
+        update_1 = update_UV or self.model['U1'] is None or self.model['V1'] is None
+        update_2 = update_UV or self.model['U2'] is None
+        if update_1 or update_2:
+            X_Q, X_R, X_P = qr_list(X)
+            worker = partial(_ecca_cal_r1_UV, n_component=n_component,
+                             ref_sig=(ref_sig_Q, ref_sig_R, ref_sig_P, ref_sig_R_pinv, ref_sig) if update_1 else None,
+                             template_sig=(template_sig_Q, template_sig_R, template_sig_P, template_sig_R_pinv, template_sig) if update_2 else None)
+            if self._use_parallel() and len(X) > 1:
+                r1_new, U1_new, V1_new, U2_new = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(worker)(a, X_Q=q, X_R=t, X_P=p) for a, q, t, p in zip(X, X_Q, X_R, X_P)))
             else:
-                r1 = []
-                U1 = []
-                V1 = []
-                for a in X:
-                    r1_temp, U1_temp, V1_temp = _r_cca_qr(a, n_component=n_component, Y_Q=ref_sig_Q, Y_R=ref_sig_R, Y_P=ref_sig_P, force_output_UV=True)
-                    r1.append(r1_temp)
-                    U1.append(U1_temp)
-                    V1.append(V1_temp)
-            self.model['U1'] = U1
-            self.model['V1'] = V1
+                r1_new, U1_new, V1_new, U2_new = zip(*[worker(a, X_Q=q, X_R=t, X_P=p) for a, q, t, p in zip(X, X_Q, X_R, X_P)])
+        
+        # r1
+        #   Stored filters of previous trials are paired with test trials by their order
+        if update_1:
+            r1 = list(r1_new)
+            self.model['U1'] = list(U1_new)
+            self.model['V1'] = list(V1_new)
+            U1 = np.stack(U1_new)
         else:
-            U1 = self.model['U1']
-            V1 = self.model['V1']
-            if self.n_jobs is not None:
-                r1 = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr_withUV, Y_Q=ref_sig_Q, Y_R=ref_sig_R, Y_P=ref_sig_P))(X=a, U=u, V=v) for a, u, v in zip(X,U1,V1))
-            else:
-                r1 = []
-                for a, u, v in zip(X,U1,V1):
-                    r1.append(
-                        _r_cca_qr_withUV(X=a, U=u, V=v, Y_Q=ref_sig_Q, Y_R=ref_sig_R, Y_P=ref_sig_P)
-                    )
+            U1 = _stack_trial_filters(self.model['U1'], len(X))
+            V1 = _stack_trial_filters(self.model['V1'], len(X))
+            r1 = _r_cca_qr_withUV(X=X_stack, U=U1, V=V1, Y_Q=ref_sig_Q, Y_R=ref_sig_R, Y_P=ref_sig_P, Y=ref_sig)
         
         # r2
-        if update_UV or self.model['U2'] is None:
-            if self.n_jobs is not None:
-                _, U2, _ = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr, n_component=n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, force_output_UV=True))(a) for a in X))
-            else:
-                U2 = []
-                for a in X:
-                    _, U2_temp, _ = _r_cca_qr(a, n_component=n_component, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, force_output_UV=True)
-                    U2.append(U2_temp)
-            self.model['U2'] = U2
-        
-        if self.n_jobs is not None:
-            r2 = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr_withUV, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P))(X=a, U=u, V=v) for a, u, v in zip(X,U2,U2))
-            
-            # r3
-            r3 = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr_withUV, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P))(X=a, U=u, V=v) for a, u, v in zip(X,U1,U1))
-            
-            # r4
-            r4 = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_qr_withUV, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, U=U3, V=U3))(X=a) for a in X)
+        if update_2:
+            self.model['U2'] = list(U2_new)
+            U2 = np.stack(U2_new)
         else:
-            r2 = []
-            for a, u, v in zip(X,U2,U2):
-                r2.append(
-                    _r_cca_qr_withUV(X=a, U=u, V=v, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P)
-                )
-            r3 = []
-            for a, u, v in zip(X,U1,U1):
-                r3.append(
-                    _r_cca_qr_withUV(X=a, U=u, V=v, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P)
-                )
-            r4 = []
-            for a in X:
-                r4.append(
-                    _r_cca_qr_withUV(X=a, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, U=U3, V=U3)
-                )
+            U2 = _stack_trial_filters(self.model['U2'], len(X))
         
+        # r2, r3 and r4
+        #   Following eCCA, the same spatial filter (U2, U1 and U3) is applied to both EEG data and templates, i.e. V = U.
+        #   V is required because templates are projected by the filter of each trial.
+        #   Filters of r2 and r3 are stacked so that the two correlations are computed in one call.
+        U_all = np.stack((U2, U1))
+        r2, r3 = _r_cca_qr_withUV(X=X_stack, U=U_all, V=U_all, Y_Q=template_sig_Q, Y_R=template_sig_R, Y_P=template_sig_P, Y=template_sig)
+        #   U3 is shared by all trials, so only EEG data are projected and templates are projected in "fit"
+        r4 = np.einsum('...n,...n->...', normalize_rows(_project_X_withU(X_stack, U3)), self.model['template_sig_proj_U3'])
         
-        Y_pred = [int( np.argmax( weights_filterbank @ (np.sign(r1_single) * np.square(r1_single) + 
-                                                        np.sign(r2_single) * np.square(r2_single) +
-                                                        np.sign(r3_single) * np.square(r3_single) +
-                                                        np.sign(r4_single) * np.square(r4_single)))) for r1_single, r2_single, r3_single, r4_single in zip(r1, r2, r3, r4)]
-        r = [(np.sign(r1_single) * np.square(r1_single) + 
-              np.sign(r2_single) * np.square(r2_single) +
-              np.sign(r3_single) * np.square(r3_single) +
-              np.sign(r4_single) * np.square(r4_single)) for r1_single, r2_single, r3_single, r4_single in zip(r1, r2, r3, r4)]
+        # sign(r) * r^2 = r * |r|
+        r = sum_signed_square([np.stack(r1), r2, r3, r4])
+        Y_pred = np.argmax(np.tensordot(r, weights_filterbank[0], axes = ([-2],[0])), axis = -1).tolist()
+        r = list(r)
         
         return Y_pred, r
 
@@ -1484,6 +1557,9 @@ class MSCCA(BaseModel):
         self.model['U'] = None
         self.model['V'] = None
         
+        self.model['ref_sig_proj'] = None
+        self.model['template_sig_proj'] = None
+        
     def __copy__(self):
         copy_model = MSCCA(n_neighbor = self.n_neighbor,
                             n_component = self.n_component,
@@ -1544,88 +1620,53 @@ class MSCCA(BaseModel):
         n_neighbor = self.n_neighbor
         # construct reference and template signals for ms-cca
         d0 = int(np.floor(n_neighbor/2))
-        U = np.zeros((filterbank_num, stimulus_num, channel_num, n_component))
-        V = np.zeros((filterbank_num, stimulus_num, harmonic_num, n_component))
-        _, freqs_idx, return_freqs_idx = sort(freqs)
-        ref_sig_sort = [ref_sig[i] for i in freqs_idx]
-        template_sig_sort = [template_sig[i] for i in freqs_idx]
-        ref_sig_mscca = []
-        template_sig_mscca = []
-        for class_idx in range(1,stimulus_num+1):
-            if class_idx <= d0:
-                start_idx = 0
-                end_idx = n_neighbor
-            elif class_idx > d0 and class_idx < (stimulus_num-d0+1):
-                start_idx = class_idx - d0 - 1
-                end_idx = class_idx + (n_neighbor-d0-1)
-            else:
-                start_idx = stimulus_num - n_neighbor
-                end_idx = stimulus_num
-            ref_sig_tmp = [ref_sig_sort[i] for i in range(start_idx, end_idx)]
-            ref_sig_mscca.append(np.concatenate(ref_sig_tmp, axis = -1))
-            template_sig_tmp = [template_sig_sort[i] for i in range(start_idx, end_idx)]
-            template_sig_mscca.append(np.concatenate(template_sig_tmp, axis = -1))
-        for filterbank_idx in range(filterbank_num):
-            if self.n_jobs is not None:
-                U_tmp, V_tmp, _ = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(canoncorr, force_output_UV = True))(X=template_sig_single[filterbank_idx,:,:].T, 
-                                                                                                                        Y=ref_sig_single.T) 
-                                                            for template_sig_single, ref_sig_single in zip(template_sig_mscca,ref_sig_mscca)))
-            else:
-                U_tmp = []
-                V_tmp = []
-                for template_sig_single, ref_sig_single in zip(template_sig_mscca,ref_sig_mscca):
-                    U_temp_temp, V_temp_temp, _ = canoncorr(X=template_sig_single[filterbank_idx,:,:].T, Y=ref_sig_single.T, force_output_UV = True)
-                    U_tmp.append(U_temp_temp)
-                    V_tmp.append(V_temp_temp)
-            try:
-                for stim_idx, (u, v) in enumerate(zip(U_tmp,V_tmp)):
-                    U[filterbank_idx, stim_idx, :, :] = u[:channel_num,:n_component]
-                    V[filterbank_idx, stim_idx, :, :] = v[:harmonic_num,:n_component]
-            except:
-                print('D')
-        self.model['U'] = U[:, return_freqs_idx, :, :]
-        self.model['V'] = V[:, return_freqs_idx, :, :]
+        _, freqs_idx, _ = sort(freqs)
+        # neighbor windows [start_idx, start_idx + n_neighbor) of all classes in the sorted frequencies, 
+        # shifted inwards at both ends
+        start_idx_all = np.clip(np.arange(1, stimulus_num+1) - d0 - 1, 0, stimulus_num - n_neighbor)
+        neighbor_idx_sort = np.asarray(freqs_idx)[start_idx_all[:,None] + np.arange(n_neighbor)]
+        # classes are stored in their original order so that filters do not need to be reordered
+        neighbor_idx = np.empty_like(neighbor_idx_sort)
+        neighbor_idx[freqs_idx] = neighbor_idx_sort
+        # signals of all windows are gathered at once and concatenated along time by one reshape
+        #   (stimulus_num * n_neighbor * ... * signal_len) -> (stimulus_num * ... * (n_neighbor*signal_len))
+        ref_sig_buf = np.moveaxis(np.stack(ref_sig, axis = 0)[neighbor_idx], 1, -2)
+        ref_sig_buf = np.reshape(ref_sig_buf, ref_sig_buf.shape[:-2] + (-1,))
+        template_sig_buf = np.moveaxis(np.stack(template_sig, axis = 0)[neighbor_idx], 1, -2)
+        template_sig_buf = np.reshape(template_sig_buf, template_sig_buf.shape[:-2] + (-1,))
+        # CCA of all filterbanks and classes in one call, which applies "canoncorr" to each pair
+        #   template: (stimulus_num * filterbank_num * (n_neighbor*signal_len) * channel_num)
+        #   reference: (stimulus_num * 1 * (n_neighbor*signal_len) * harmonic_num)
+        U, V, _ = canoncorr_stack(X = np.swapaxes(template_sig_buf, -1, -2),
+                                  Y = np.expand_dims(np.swapaxes(ref_sig_buf, -1, -2), axis = 1))
+        # filters are stored as contiguous arrays instead of transposed views
+        U = np.ascontiguousarray(np.swapaxes(U[:, :, :channel_num, :n_component], 0, 1))
+        V = np.ascontiguousarray(np.swapaxes(V[:, :, :harmonic_num, :n_component], 0, 1))
+        self.model['U'] = U
+        self.model['V'] = V
+        
+        # Projections of reference and template signals do not change between trials.
+        # They are normalized once here so that "predict" only needs dot products.
+        self.model['ref_sig_proj'] = normalize_rows(_project_Y_withV(ref_sig, self.model['V']))
+        self.model['template_sig_proj'] = normalize_rows(_project_Y_withV(template_sig, self.model['U']))
+        # validate weights of filterbanks once the number of filterbanks is known
+        self.get_weights_filterbank(filterbank_num = filterbank_num)
         
         
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
-
-        ref_sig = self.model['ref_sig']
-        template_sig = self.model['template_sig']
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
+
         U = self.model['U']
-        V = self.model['V']
 
-        if self.n_jobs is not None:
-            r1 = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=ref_sig, U=U, V=V))(X=a) for a in X)
-            r2 = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r1 = []
-            for a in X:
-                r1.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=ref_sig, U=U, V=V)
-                )
-            r2 = []
-            for a in X:
-                r2.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
-        
-        Y_pred = [int( np.argmax( weights_filterbank @ (np.sign(r1_single) * np.square(r1_single) + 
-                                                        np.sign(r2_single) * np.square(r2_single)))) for r1_single, r2_single in zip(r1, r2)]
+        # r1 and r2 share the projection of EEG data by U
+        a = normalize_rows(_project_X_withU(np.stack(X), U))
+        r1 = np.einsum('...n,...n->...', a, self.model['ref_sig_proj'])
+        r2 = np.einsum('...n,...n->...', a, self.model['template_sig_proj'])
         
-        r = [(np.sign(r1_single) * np.square(r1_single) + 
-              np.sign(r2_single) * np.square(r2_single)) for r1_single, r2_single in zip(r1, r2)]
+        # sign(r) * r^2 = r * |r|
+        r = sum_signed_square([r1, r2])
+        Y_pred = np.argmax(np.tensordot(r, weights_filterbank[0], axes = ([-2],[0])), axis = -1).tolist()
+        r = list(r)
         
         return Y_pred, r
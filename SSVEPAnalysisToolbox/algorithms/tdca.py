@@ -12,7 +12,7 @@ import warnings
 import numpy as np
 
 from .basemodel import BaseModel
-from .utils import qr_list, mean_list, sum_list, eigvec
+from .utils import qr_list, mean_list, sum_list, eigvec, corrcoef_rows
 
 def _covariance_tdca(X: ndarray, 
                      X_mean: ndarray, 
@@ -32,11 +32,14 @@ def _r_tdca_canoncorr_withUV(X: ndarray,
     """
     Calculate correlation of CCA based on canoncorr for single trial data using existing U and V
 
+    Several trials can be computed in one call by stacking them along a leading axis.
+
     Parameters
     ----------
     X : ndarray
         Single trial EEG data
         EEG shape: (filterbank_num, channel_num, signal_len)
+        or stacked EEG data: (trial_num, filterbank_num, channel_num, signal_len)
     Y : List[ndarray]
         List of reference signals
     P : List[ndarray]
@@ -53,41 +56,22 @@ def _r_tdca_canoncorr_withUV(X: ndarray,
     R : ndarray
         Correlation
         shape: (filterbank_num * stimulus_num)
+        or (trial_num * filterbank_num * stimulus_num)
     """
-    filterbank_num, channel_num, signal_len = X.shape
-    if len(Y[0].shape)==2:
-        harmonic_num = Y[0].shape[0]
-    elif len(Y[0].shape)==3:
-        harmonic_num = Y[0].shape[1]
+    Y = np.stack(Y)
+    if len(Y.shape)==3: # reference: (stimulus_num, harmonic_num, signal_len)
+        b = np.einsum('kshn,sht->ksnt', V, Y)
+    elif len(Y.shape)==4: # template: (stimulus_num, filterbank_num, harmonic_num, signal_len)
+        b = np.einsum('kshn,skht->ksnt', V, Y)
     else:
         raise ValueError('Unknown data type')
-    stimulus_num = len(Y)
-    
-    R = np.zeros((filterbank_num, stimulus_num))
+    # U^T [X, X P] = [U^T X, (U^T X) P]
+    a = np.einsum('kscn,...kct->...ksnt', U, X)
+    a = np.concatenate([a, a @ np.stack(P)], axis = -1)
     
-    for k in range(filterbank_num):
-        tmp_X = X[k,:,:]
-        for i in range(stimulus_num):
-            tmp = np.concatenate([tmp_X, tmp_X @ P[i]], axis=-1)
-            if len(Y[i].shape)==2:
-                Y_tmp = Y[i]
-            elif len(Y[i].shape)==3:
-                Y_tmp = Y[i][k,:,:]
-            else:
-                raise ValueError('Unknown data type')
-            
-            A_r = U[k,i,:,:]
-            B_r = V[k,i,:,:]
-            
-            a = A_r.T @ tmp
-            b = B_r.T @ Y_tmp
-            a = np.reshape(a, (-1))
-            b = np.reshape(b, (-1))
-            
-            # r2 = stats.pearsonr(a, b)[0]
-            # r = stats.pearsonr(a, b)[0]
-            r = np.corrcoef(a, b)[0,1]
-            R[k,i] = r
+    R = corrcoef_rows(np.reshape(a, a.shape[:-2] + (-1,)),
+                      np.reshape(b, b.shape[:-2] + (-1,)),
+                      overwrite_input = True)
     return R
 
 def _gen_delay_X(X: List[ndarray],
@@ -206,7 +190,7 @@ class TDCA(BaseModel):
         if ref_sig is None:
             raise ValueError("TDCA requires reference signals")
 
-        ref_sig_Q, _, _ = qr_list(ref_sig)
+        ref_sig_Q, _, _ = qr_list(ref_sig, pivoting = False)
         ref_sig_P = [Q @ Q.T for Q in ref_sig_Q]
         self.model['ref_sig_P'] = ref_sig_P
 
@@ -225,9 +209,10 @@ class TDCA(BaseModel):
             X_train = [[X[i][filterbank_idx,:,:] for i in np.where(np.array(Y) == class_val)[0]] for class_val in possible_class]
             trial_num = len(X_train[0])
 
-            if self.n_jobs is not None:
-                X_train_delay = Parallel(n_jobs = self.n_jobs)(delayed(partial(_gen_delay_X, n_delay = n_delay))(X = X_single_class) for X_single_class in X_train)
-                P_combine_X_train = Parallel(n_jobs = self.n_jobs)(delayed(_gen_P_combine_X)(X = X_single_class, P = P_single_class) for X_single_class, P_single_class in zip(X_train_delay, ref_sig_P))
+            if self._use_parallel():
+                worker = delayed(partial(_gen_delay_X, n_delay = n_delay))
+                X_train_delay = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(X = X_single_class) for X_single_class in X_train)
+                P_combine_X_train = Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_gen_P_combine_X)(X = X_single_class, P = P_single_class) for X_single_class, P_single_class in zip(X_train_delay, ref_sig_P))
             else:
                 X_train_delay = []
                 for X_single_class in X_train:
@@ -240,8 +225,8 @@ class TDCA(BaseModel):
                         _gen_P_combine_X(X = X_single_class, P = P_single_class)
                     )
             # Calculate template
-            if self.n_jobs is not None:
-                P_combine_X_train_mean = Parallel(n_jobs=self.n_jobs)(delayed(mean_list)(X = P_combine_X_train_single_class) for P_combine_X_train_single_class in P_combine_X_train)
+            if self._use_parallel():
+                P_combine_X_train_mean = Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(mean_list)(X = P_combine_X_train_single_class) for P_combine_X_train_single_class in P_combine_X_train)
             else:
                 P_combine_X_train_mean = []
                 for P_combine_X_train_single_class in P_combine_X_train:
@@ -259,14 +244,13 @@ class TDCA(BaseModel):
                     X_tmp.append(X_tmp_tmp)
                     X_mean.append(P_combine_X_train_mean_single_class)
 
-            if self.n_jobs is not None:
-                Sw_list = Parallel(n_jobs=self.n_jobs)(delayed(partial(_covariance_tdca, num = trial_num,
-                                                                                        division_num = trial_num))(X = X_tmp_tmp, X_mean = X_mean_tmp)
-                                                                                        for X_tmp_tmp, X_mean_tmp in zip(X_tmp, X_mean))
-                Sb_list = Parallel(n_jobs=self.n_jobs)(delayed(partial(_covariance_tdca, X_mean = P_combine_X_train_all_mean,
-                                                                                        num = stimulus_num,
-                                                                                        division_num = stimulus_num))(X = P_combine_X_train_mean_single_class)
-                                                                                        for P_combine_X_train_mean_single_class in P_combine_X_train_mean)
+            if self._use_parallel():
+                worker = delayed(partial(_covariance_tdca, num = trial_num, division_num = trial_num))
+                Sw_list = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(X = X_tmp_tmp, X_mean = X_mean_tmp)
+                                                                            for X_tmp_tmp, X_mean_tmp in zip(X_tmp, X_mean))
+                worker = delayed(partial(_covariance_tdca, X_mean = P_combine_X_train_all_mean, num = stimulus_num, division_num = stimulus_num))
+                Sb_list = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(X = P_combine_X_train_mean_single_class)
+                                                                            for P_combine_X_train_mean_single_class in P_combine_X_train_mean)
             else:
                 Sw_list = []
                 for X_tmp_tmp, X_mean_tmp in zip(X_tmp, X_mean):
@@ -290,18 +274,7 @@ class TDCA(BaseModel):
 
     def predict(self,
             X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
         n_delay = self.n_delay
 
         X_delay = _gen_delay_X(X, n_delay)
@@ -310,15 +283,9 @@ class TDCA(BaseModel):
         U = self.model['U'] 
         ref_sig_P = self.model['ref_sig_P']
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_tdca_canoncorr_withUV, Y=template_sig, P=ref_sig_P, U=U, V=U))(X=a) for a in X_delay)
-        else:
-            r = []
-            for a in X_delay:
-                r.append(
-                    _r_tdca_canoncorr_withUV(X=a, Y=template_sig, P=ref_sig_P, U=U, V=U)
-                )
+        r = _r_tdca_canoncorr_withUV(X=np.stack(X_delay), Y=template_sig, P=ref_sig_P, U=U, V=U)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
+        Y_pred = np.argmax(weights_filterbank @ r, axis = -1)[:,0].tolist()
+        r = list(r)
         
         return Y_pred, r
\ No newline at end of file
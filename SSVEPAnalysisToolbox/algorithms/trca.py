@@ -12,9 +12,10 @@ import warnings
 import numpy as np
 
 from .basemodel import BaseModel
+from .cca import _r_cca_canoncorr_withUV_trials
 from .utils import (
-    gen_template, sort, canoncorr, separate_trainSig, qr_list, blkrep, eigvec, cholesky,
-    inv, repmat
+    gen_template, sort, canoncorr_stack, separate_trainSig, qr_list, blkrep, eigvec, cholesky,
+    inv, repmat, sum_signed_square
 )
 
 def _sscor_cal_U(X_single_stimulus : ndarray,
@@ -94,7 +95,7 @@ def _trca_U_1(X: list) -> Tuple[ndarray, ndarray]:
     trca_X1 : ndarray
     trca_X2 : ndarray
     """
-    trca_X1 = np.zeros(X[0].shape)
+    trca_X1 = np.zeros(X[0].shape, dtype = X[0].dtype)
     trca_X2 = []
     for X0 in X:
         trca_X1 = trca_X1 + X0
@@ -146,69 +147,6 @@ def _trca_U(X: list) -> ndarray:
 
     return eig_vec
 
-def _r_cca_canoncorr_withUV(X: ndarray,
-                            Y: List[ndarray],
-                            U: ndarray,
-                            V: ndarray) -> ndarray:
-    """
-    Calculate correlation of CCA based on canoncorr for single trial data using existing U and V
-
-    Parameters
-    ----------
-    X : ndarray
-        Single trial EEG data
-        EEG shape: (filterbank_num, channel_num, signal_len)
-    Y : List[ndarray]
-        List of reference signals
-    U : ndarray
-        Spatial filter
-        shape: (filterbank_num * stimulus_num * channel_num * n_component)
-    V : ndarray
-        Weights of harmonics
-        shape: (filterbank_num * stimulus_num * harmonic_num * n_component)
-
-    Returns
-    -------
-    R : ndarray
-        Correlation
-        shape: (filterbank_num * stimulus_num)
-    """
-    filterbank_num, channel_num, signal_len = X.shape
-    if len(Y[0].shape)==2:
-        harmonic_num = Y[0].shape[0]
-    elif len(Y[0].shape)==3:
-        harmonic_num = Y[0].shape[1]
-    else:
-        raise ValueError('Unknown data type')
-    stimulus_num = len(Y)
-    
-    R = np.zeros((filterbank_num, stimulus_num))
-    
-    for k in range(filterbank_num):
-        tmp = X[k,:,:]
-        for i in range(stimulus_num):
-            if len(Y[i].shape)==2:
-                Y_tmp = Y[i]
-            elif len(Y[i].shape)==3:
-                Y_tmp = Y[i][k,:,:]
-            else:
-                raise ValueError('Unknown data type')
-            
-            A_r = U[k,i,:,:]
-            B_r = V[k,i,:,:]
-            
-            a = A_r.T @ tmp
-            b = B_r.T @ Y_tmp
-            a = np.reshape(a, (-1))
-            b = np.reshape(b, (-1))
-            
-            # r2 = stats.pearsonr(a, b)[0]
-            # r = stats.pearsonr(a, b)[0]
-            r = np.corrcoef(a, b)[0,1]
-            R[k,i] = r
-    return R
-
-
 class TRCA(BaseModel):
     """
     TRCA method
@@ -261,13 +199,13 @@ class TRCA(BaseModel):
         stimulus_num = len(template_sig)
         channel_num = template_sig[0].shape[1]
         n_component = self.n_component
-        U_trca = np.zeros((filterbank_num, stimulus_num, channel_num, n_component))
+        U_trca = np.zeros((filterbank_num, stimulus_num, channel_num, n_component), dtype = X[0].dtype)
         possible_class = list(set(Y))
         possible_class.sort(reverse = False)
         for filterbank_idx in range(filterbank_num):
             X_train = [[X[i][filterbank_idx,:,:] for i in np.where(np.array(Y) == class_val)[0]] for class_val in possible_class]
-            if self.n_jobs is not None:
-                U = Parallel(n_jobs = self.n_jobs)(delayed(_trca_U)(X = X_single_class) for X_single_class in X_train)
+            if self._use_parallel():
+                U = Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_trca_U)(X = X_single_class) for X_single_class in X_train)
             else:
                 U = []
                 for X_single_class in X_train:
@@ -280,32 +218,15 @@ class TRCA(BaseModel):
 
     def predict(self,
             X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         template_sig = self.model['template_sig']
         U = self.model['U'] 
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r = []
-            for a in X:
-                r.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
+        r = _r_cca_canoncorr_withUV_trials(X=X, Y=template_sig, U=U, V=U)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
+        Y_pred = np.argmax(weights_filterbank @ r, axis = -1)[:,0].tolist()
+        r = list(r)
         
         return Y_pred, r
 
@@ -362,10 +283,11 @@ class TRCAwithR(BaseModel):
         self.model['template_sig'] = template_sig
 
         separated_trainSig = separate_trainSig(X, Y)
-        ref_sig_Q, ref_sig_R, ref_sig_P = qr_list(ref_sig)
+        ref_sig_Q, _, _ = qr_list(ref_sig, pivoting = False)
 
-        if self.n_jobs is not None:
-            U_all_stimuli = Parallel(n_jobs=self.n_jobs)(delayed(partial(_trcaR_cal_template_U, n_component = self.n_component))(X_single_stimulus = a, I = Q @ Q.T) for a, Q in zip(separated_trainSig, ref_sig_Q))
+        if self._use_parallel():
+            worker = delayed(partial(_trcaR_cal_template_U, n_component = self.n_component))
+            U_all_stimuli = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(X_single_stimulus = a, I = Q @ Q.T) for a, Q in zip(separated_trainSig, ref_sig_Q))
         else:
             U_all_stimuli = []
             for a, Q in zip(separated_trainSig, ref_sig_Q):
@@ -378,32 +300,15 @@ class TRCAwithR(BaseModel):
 
     def predict(self,
             X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         template_sig = self.model['template_sig']
         U = self.model['U'] 
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r = []
-            for a in X:
-                r.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
+        r = _r_cca_canoncorr_withUV_trials(X=X, Y=template_sig, U=U, V=U)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
+        Y_pred = np.argmax(weights_filterbank @ r, axis = -1)[:,0].tolist()
+        r = list(r)
         
         return Y_pred, r
 
@@ -462,13 +367,13 @@ class ETRCA(BaseModel):
         stimulus_num = len(template_sig)
         channel_num = template_sig[0].shape[1]
         # n_component = 1
-        U_trca = np.zeros((filterbank_num, 1, channel_num, stimulus_num))
+        U_trca = np.zeros((filterbank_num, 1, channel_num, stimulus_num), dtype = X[0].dtype)
         possible_class = list(set(Y))
         possible_class.sort(reverse = False)
         for filterbank_idx in range(filterbank_num):
             X_train = [[X[i][filterbank_idx,:,:] for i in np.where(np.array(Y) == class_val)[0]] for class_val in possible_class]
-            if self.n_jobs is not None:
-                U = Parallel(n_jobs = self.n_jobs)(delayed(_trca_U)(X = X_single_class) for X_single_class in X_train)
+            if self._use_parallel():
+                U = Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_trca_U)(X = X_single_class) for X_single_class in X_train)
             else:
                 U = []
                 for X_single_class in X_train:
@@ -487,32 +392,15 @@ class ETRCA(BaseModel):
 
     def predict(self,
             X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         template_sig = self.model['template_sig']
         U = self.model['U'] 
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r = []
-            for a in X:
-                r.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
+        r = _r_cca_canoncorr_withUV_trials(X=X, Y=template_sig, U=U, V=U)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
+        Y_pred = np.argmax(weights_filterbank @ r, axis = -1)[:,0].tolist()
+        r = list(r)
         
         return Y_pred, r
 
@@ -572,10 +460,11 @@ class ETRCAwithR(BaseModel):
         self.model['template_sig'] = template_sig
 
         separated_trainSig = separate_trainSig(X, Y)
-        ref_sig_Q, ref_sig_R, ref_sig_P = qr_list(ref_sig)
+        ref_sig_Q, _, _ = qr_list(ref_sig, pivoting = False)
 
-        if self.n_jobs is not None:
-            U_all_stimuli = Parallel(n_jobs=self.n_jobs)(delayed(partial(_trcaR_cal_template_U, n_component = self.n_component))(X_single_stimulus = a, I = Q @ Q.T) for a, Q in zip(separated_trainSig, ref_sig_Q))
+        if self._use_parallel():
+            worker = delayed(partial(_trcaR_cal_template_U, n_component = self.n_component))
+            U_all_stimuli = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(X_single_stimulus = a, I = Q @ Q.T) for a, Q in zip(separated_trainSig, ref_sig_Q))
         else:
             U_all_stimuli = []
             for a, Q in zip(separated_trainSig, ref_sig_Q):
@@ -590,32 +479,15 @@ class ETRCAwithR(BaseModel):
 
     def predict(self,
             X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         template_sig = self.model['template_sig']
         U = self.model['U'] 
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r = []
-            for a in X:
-                r.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
+        r = _r_cca_canoncorr_withUV_trials(X=X, Y=template_sig, U=U, V=U)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
+        Y_pred = np.argmax(weights_filterbank @ r, axis = -1)[:,0].tolist()
+        r = list(r)
         
         return Y_pred, r
 
@@ -685,16 +557,16 @@ class MSETRCA(BaseModel):
         n_neighbor = self.n_neighbor
         # n_component = 1
         d0 = int(np.floor(n_neighbor/2))
-        _, freqs_idx, return_freqs_idx = sort(freqs)
-        U_trca = np.zeros((filterbank_num, 1, channel_num, stimulus_num))
+        _, freqs_idx, _ = sort(freqs)
+        U_trca = np.zeros((filterbank_num, 1, channel_num, stimulus_num), dtype = X[0].dtype)
         possible_class = list(set(Y))
         possible_class.sort(reverse = False)
         for filterbank_idx in range(filterbank_num):
             X_train = [[X[i][filterbank_idx,:,:] for i in np.where(np.array(Y) == class_val)[0]] for class_val in possible_class]
             X_train = [X_train[i] for i in freqs_idx]
 
-            if self.n_jobs is not None:
-                trca_X1, trca_X2 = zip(*Parallel(n_jobs=self.n_jobs)(delayed(_trca_U_1)(a) for a in X_train))
+            if self._use_parallel():
+                trca_X1, trca_X2 = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_trca_U_1)(a) for a in X_train))
             else:
                 trca_X1 = []
                 trca_X2 = []
@@ -720,48 +592,32 @@ class MSETRCA(BaseModel):
                 trca_X2_mstrca_tmp = [trca_X2[i].T for i in range(start_idx, end_idx)]
                 trca_X2_mstrca.append(np.concatenate(trca_X2_mstrca_tmp, axis=-1))
 
-            if self.n_jobs is not None:
-                U = Parallel(n_jobs = self.n_jobs)(delayed(_trca_U_2)(trca_X1 = trca_X1_single_class, trca_X2 = trca_X2_single_class.T) for trca_X1_single_class, trca_X2_single_class in zip(trca_X1_mstrca, trca_X2_mstrca))
+            if self._use_parallel():
+                U = Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_trca_U_2)(trca_X1 = trca_X1_single_class, trca_X2 = trca_X2_single_class.T) for trca_X1_single_class, trca_X2_single_class in zip(trca_X1_mstrca, trca_X2_mstrca))
             else:
                 U = []
                 for trca_X1_single_class, trca_X2_single_class in zip(trca_X1_mstrca, trca_X2_mstrca):
                     U.append(
                         _trca_U_2(trca_X1 = trca_X1_single_class, trca_X2 = trca_X2_single_class.T)
                     )
+            # write filters to the original order of classes directly
             for stim_idx, u in enumerate(U):
-                U_trca[filterbank_idx, 0, :, stim_idx] = u[:channel_num,0]
-        U_trca = np.repeat(U_trca[:,:,:,return_freqs_idx], repeats = stimulus_num, axis = 1)
+                U_trca[filterbank_idx, 0, :, freqs_idx[stim_idx]] = u[:channel_num,0]
+        U_trca = np.repeat(U_trca, repeats = stimulus_num, axis = 1)
 
         self.model['U'] = U_trca
 
     def predict(self,
             X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         template_sig = self.model['template_sig']
         U = self.model['U'] 
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r = []
-            for a in X:
-                r.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
+        r = _r_cca_canoncorr_withUV_trials(X=X, Y=template_sig, U=U, V=U)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
+        Y_pred = np.argmax(weights_filterbank @ r, axis = -1)[:,0].tolist()
+        r = list(r)
         
         return Y_pred, r
 
@@ -864,11 +720,14 @@ class MSCCA_and_MSETRCA(BaseModel):
         n_neighbor = self.n_neighbor_mscca
         # construct reference and template signals for ms-cca
         d0 = int(np.floor(n_neighbor/2))
-        U = np.zeros((filterbank_num, stimulus_num, channel_num, n_component))
-        V = np.zeros((filterbank_num, stimulus_num, harmonic_num, n_component))
-        _, freqs_idx, return_freqs_idx = sort(freqs)
-        ref_sig_sort = [ref_sig[i] for i in freqs_idx]
-        template_sig_sort = [template_sig[i] for i in freqs_idx]
+        U = np.empty((filterbank_num, stimulus_num, channel_num, n_component), dtype = template_sig[0].dtype)
+        V = np.empty((filterbank_num, stimulus_num, harmonic_num, n_component), dtype = template_sig[0].dtype)
+        _, freqs_idx, _ = sort(freqs)
+        # all classes share the same signal length, so neighbors are stacked once and windows are taken by slicing
+        #   ref_sig_sort: (harmonic_num * stimulus_num * signal_len)
+        #   template_sig_sort: (filterbank_num * channel_num * stimulus_num * signal_len)
+        ref_sig_sort = np.stack([ref_sig[i] for i in freqs_idx], axis = 1)
+        template_sig_sort = np.stack([template_sig[i] for i in freqs_idx], axis = 2)
         ref_sig_mscca = []
         template_sig_mscca = []
         for class_idx in range(1,stimulus_num+1):
@@ -881,27 +740,28 @@ class MSCCA_and_MSETRCA(BaseModel):
             else:
                 start_idx = stimulus_num - n_neighbor
                 end_idx = stimulus_num
-            ref_sig_tmp = [ref_sig_sort[i] for i in range(start_idx, end_idx)]
-            ref_sig_mscca.append(np.concatenate(ref_sig_tmp, axis = -1))
-            template_sig_tmp = [template_sig_sort[i] for i in range(start_idx, end_idx)]
-            template_sig_mscca.append(np.concatenate(template_sig_tmp, axis = -1))
-        for filterbank_idx in range(filterbank_num):
-            if self.n_jobs is not None:
-                U_tmp, V_tmp, _ = zip(*Parallel(n_jobs=self.n_jobs)(delayed(partial(canoncorr, force_output_UV = True))(X=template_sig_single[filterbank_idx,:,:].T, 
-                                                                                                                        Y=ref_sig_single.T) 
-                                                            for template_sig_single, ref_sig_single in zip(template_sig_mscca,ref_sig_mscca)))
-            else:
-                U_tmp = []
-                V_tmp = []
-                for template_sig_single, ref_sig_single in zip(template_sig_mscca,ref_sig_mscca):
-                    U_temp_temp, V_temp_temp, _ = canoncorr(X=template_sig_single[filterbank_idx,:,:].T, Y=ref_sig_single.T, force_output_UV = True)
-                    U_tmp.append(U_temp_temp)
-                    V_tmp.append(V_temp_temp)
-            for stim_idx, (u, v) in enumerate(zip(U_tmp,V_tmp)):
-                U[filterbank_idx, stim_idx, :, :] = u[:channel_num,:n_component]
-                V[filterbank_idx, stim_idx, :, :] = v[:harmonic_num,:n_component]
-        self.model['U_mscca'] = U[:, return_freqs_idx, :, :]
-        self.model['V_mscca'] = V[:, return_freqs_idx, :, :]
+            ref_sig_mscca.append(ref_sig_sort[:, start_idx:end_idx, :].reshape(harmonic_num, -1))
+            template_sig_mscca.append(template_sig_sort[:, :, start_idx:end_idx, :].reshape(filterbank_num, channel_num, -1))
+        # CCA of all filterbanks and classes in one call, following "MSCCA"
+        #   template: (stimulus_num * filterbank_num * (n_neighbor*signal_len) * channel_num)
+        #   reference: (stimulus_num * 1 * (n_neighbor*signal_len) * harmonic_num)
+        # If there are less classes than n_neighbor, windows have different lengths 
+        # and all filterbanks of each class are decomposed in one call instead.
+        if len(set(t.shape for t in template_sig_mscca)) == 1:
+            U_sort, V_sort, _ = canoncorr_stack(X = np.swapaxes(np.stack(template_sig_mscca, axis = 0), -1, -2),
+                                                Y = np.expand_dims(np.swapaxes(np.stack(ref_sig_mscca, axis = 0), -1, -2), axis = 1))
+            U_sort = U_sort[:, :, :channel_num, :n_component]
+            V_sort = V_sort[:, :, :harmonic_num, :n_component]
+        else:
+            U_sort, V_sort = zip(*[canoncorr_stack(X = np.swapaxes(t, -1, -2), Y = np.swapaxes(r, -1, -2))[:2]
+                                   for t, r in zip(template_sig_mscca, ref_sig_mscca)])
+            U_sort = np.stack([u[:, :channel_num, :n_component] for u in U_sort], axis = 0)
+            V_sort = np.stack([v[:, :harmonic_num, :n_component] for v in V_sort], axis = 0)
+        # filters are stored in the original order of classes
+        U[:, freqs_idx, :, :] = np.swapaxes(U_sort, 0, 1)
+        V[:, freqs_idx, :, :] = np.swapaxes(V_sort, 0, 1)
+        self.model['U_mscca'] = U
+        self.model['V_mscca'] = V
     
     def fit_msetrca(self,
                     freqs: Optional[List[float]] = None,
@@ -916,16 +776,16 @@ class MSCCA_and_MSETRCA(BaseModel):
         n_neighbor = self.n_neighber_msetrca
         # n_component = 1
         d0 = int(np.floor(n_neighbor/2))
-        _, freqs_idx, return_freqs_idx = sort(freqs)
-        U_trca = np.zeros((filterbank_num, 1, channel_num, stimulus_num))
+        _, freqs_idx, _ = sort(freqs)
+        U_trca = np.zeros((filterbank_num, 1, channel_num, stimulus_num), dtype = X[0].dtype)
         possible_class = list(set(Y))
         possible_class.sort(reverse = False)
         for filterbank_idx in range(filterbank_num):
             X_train = [[X[i][filterbank_idx,:,:] for i in np.where(np.array(Y) == class_val)[0]] for class_val in possible_class]
             X_train = [X_train[i] for i in freqs_idx]
 
-            if self.n_jobs is not None:
-                trca_X1, trca_X2 = zip(*Parallel(n_jobs=self.n_jobs)(delayed(_trca_U_1)(a) for a in X_train))
+            if self._use_parallel():
+                trca_X1, trca_X2 = zip(*Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_trca_U_1)(a) for a in X_train))
             else:
                 trca_X1 = []
                 trca_X2 = []
@@ -951,17 +811,18 @@ class MSCCA_and_MSETRCA(BaseModel):
                 trca_X2_mstrca_tmp = [trca_X2[i].T for i in range(start_idx, end_idx)]
                 trca_X2_mstrca.append(np.concatenate(trca_X2_mstrca_tmp, axis=-1))
 
-            if self.n_jobs is not None:
-                U = Parallel(n_jobs = self.n_jobs)(delayed(_trca_U_2)(trca_X1 = trca_X1_single_class, trca_X2 = trca_X2_single_class.T) for trca_X1_single_class, trca_X2_single_class in zip(trca_X1_mstrca, trca_X2_mstrca))
+            if self._use_parallel():
+                U = Parallel(n_jobs=self.n_jobs, backend='threading')(delayed(_trca_U_2)(trca_X1 = trca_X1_single_class, trca_X2 = trca_X2_single_class.T) for trca_X1_single_class, trca_X2_single_class in zip(trca_X1_mstrca, trca_X2_mstrca))
             else:
                 U = []
                 for trca_X1_single_class, trca_X2_single_class in zip(trca_X1_mstrca, trca_X2_mstrca):
                     U.append(
                         _trca_U_2(trca_X1 = trca_X1_single_class, trca_X2 = trca_X2_single_class.T)
                     )
+            # write filters to the original order of classes directly
             for stim_idx, u in enumerate(U):
-                U_trca[filterbank_idx, 0, :, stim_idx] = u[:channel_num,0]
-        U_trca = np.repeat(U_trca[:,:,:,return_freqs_idx], repeats = stimulus_num, axis = 1)
+                U_trca[filterbank_idx, 0, :, freqs_idx[stim_idx]] = u[:channel_num,0]
+        U_trca = np.repeat(U_trca, repeats = stimulus_num, axis = 1)
 
         self.model['U_msetrca'] = U_trca
         
@@ -973,18 +834,7 @@ class MSCCA_and_MSETRCA(BaseModel):
         U = self.model['U_mscca']
         V = self.model['V_mscca']
 
-        if self.n_jobs is not None:
-            r1 = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=ref_sig, U=U, V=V))(X=a) for a in X)
-            # r2 = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-            
-            # Y_pred = [int( np.argmax( weights_filterbank @ (np.sign(r1_single) * np.square(r1_single) + 
-            #                                                 np.sign(r2_single) * np.square(r2_single)))) for r1_single, r2_single in zip(r1, r2)]
-        else:
-            r1 = []
-            for a in X:
-                r1.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=ref_sig, U=U, V=V)
-                )
+        r1 = list(_r_cca_canoncorr_withUV_trials(X=X, Y=ref_sig, U=U, V=V))
         
         return r1
     def predict_msetrca(self,
@@ -992,14 +842,7 @@ class MSCCA_and_MSETRCA(BaseModel):
         template_sig = self.model['template_sig']
         U = self.model['U_msetrca'] 
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r = []
-            for a in X:
-                r.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
+        r = list(_r_cca_canoncorr_withUV_trials(X=X, Y=template_sig, U=U, V=U))
 
         # Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
         
@@ -1007,27 +850,15 @@ class MSCCA_and_MSETRCA(BaseModel):
 
     def predict(self,
                 X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         r1 = self.predict_mscca(X)
         r2 = self.predict_msetrca(X)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ (np.sign(r1_single) * np.square(r1_single) + 
-                                                        np.sign(r2_single) * np.square(r2_single)))) for r1_single, r2_single in zip(r1, r2)]
-
-        r = [(np.sign(r1_single) * np.square(r1_single) + 
-              np.sign(r2_single) * np.square(r2_single)) for r1_single, r2_single in zip(r1, r2)]
+        # sign(r) * r^2 = r * |r|
+        r = sum_signed_square([np.stack(r1), np.stack(r2)])
+        Y_pred = np.argmax(np.tensordot(r, weights_filterbank[0], axes = ([-2],[0])), axis = -1).tolist()
+        r = list(r)
 
         return Y_pred, r
 
@@ -1078,8 +909,9 @@ class SSCOR(BaseModel):
 
         separated_trainSig = separate_trainSig(X, Y)
 
-        if self.n_jobs is not None:
-            U_allstimuli = Parallel(n_jobs=self.n_jobs)(delayed(partial(_sscor_cal_U, n_component=self.n_component))(X_single_stimulus=a) for a in separated_trainSig)
+        if self._use_parallel():
+            worker = delayed(partial(_sscor_cal_U, n_component = self.n_component))
+            U_allstimuli = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(X_single_stimulus=a) for a in separated_trainSig)
         else:
             U_allstimuli = []
             for a in separated_trainSig:
@@ -1092,32 +924,15 @@ class SSCOR(BaseModel):
 
     def predict(self,
             X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         template_sig = self.model['template_sig']
         U = self.model['U'] 
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r = []
-            for a in X:
-                r.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
+        r = _r_cca_canoncorr_withUV_trials(X=X, Y=template_sig, U=U, V=U)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
+        Y_pred = np.argmax(weights_filterbank @ r, axis = -1)[:,0].tolist()
+        r = list(r)
         
         return Y_pred, r
 
@@ -1172,8 +987,9 @@ class ESSCOR(BaseModel):
         separated_trainSig = separate_trainSig(X, Y)
 
         stimulus_num = len(template_sig)
-        if self.n_jobs is not None:
-            U_allstimuli = Parallel(n_jobs=self.n_jobs)(delayed(partial(_sscor_cal_U, n_component = self.n_component))(X_single_stimulus=a) for a in separated_trainSig)
+        if self._use_parallel():
+            worker = delayed(partial(_sscor_cal_U, n_component = self.n_component))
+            U_allstimuli = Parallel(n_jobs=self.n_jobs, backend='threading')(worker(X_single_stimulus=a) for a in separated_trainSig)
         else:
             U_allstimuli = []
             for a in separated_trainSig:
@@ -1188,31 +1004,14 @@ class ESSCOR(BaseModel):
 
     def predict(self,
             X: List[ndarray]) -> List[int]:
-        weights_filterbank = self.model['weights_filterbank']
-        if weights_filterbank is None:
-            weights_filterbank = [1 for _ in range(X[0].shape[0])]
-        if type(weights_filterbank) is list:
-            weights_filterbank = np.expand_dims(np.array(weights_filterbank),1).T
-        else:
-            if len(weights_filterbank.shape) != 2:
-                raise ValueError("'weights_filterbank' has wrong shape")
-            if weights_filterbank.shape[0] != 1:
-                weights_filterbank = weights_filterbank.T
-        if weights_filterbank.shape[0] != 1:
-            raise ValueError("'weights_filterbank' has wrong shape")
+        weights_filterbank = self.get_weights_filterbank(filterbank_num = X[0].shape[0])
 
         template_sig = self.model['template_sig']
         U = self.model['U'] 
 
-        if self.n_jobs is not None:
-            r = Parallel(n_jobs=self.n_jobs)(delayed(partial(_r_cca_canoncorr_withUV, Y=template_sig, U=U, V=U))(X=a) for a in X)
-        else:
-            r = []
-            for a in X:
-                r.append(
-                    _r_cca_canoncorr_withUV(X=a, Y=template_sig, U=U, V=U)
-                )
+        r = _r_cca_canoncorr_withUV_trials(X=X, Y=template_sig, U=U, V=U)
 
-        Y_pred = [int( np.argmax( weights_filterbank @ r_tmp)) for r_tmp in r]
+        Y_pred = np.argmax(weights_filterbank @ r, axis = -1)[:,0].tolist()
+        r = list(r)
         
         return Y_pred, r
\ No newline at end of file
@@ -11,14 +11,61 @@ import numpy.matlib as npmat
 def inv(X : ndarray):
     return nplin.inv(X)
 
+def pinv(X : ndarray):
+    return slin.pinv(X)
+
 def repmat(X : ndarray,
            rep_x : int,
            rep_y : int):
     return npmat.repmat(X, rep_x, rep_y)
 
+# raw LAPACK routines used by "svd" to skip the argument handling of slin.svd
+_gesvd = {np.dtype(dtype): slin.lapack.get_lapack_funcs(('gesvd',), (np.empty((1,1), dtype=dtype),))[0]
+          for dtype in (np.float32, np.float64)}
+_gesdd = {np.dtype(dtype): slin.lapack.get_lapack_funcs(('gesdd',), (np.empty((1,1), dtype=dtype),))[0]
+          for dtype in (np.float32, np.float64)}
+# raw LAPACK routines used by "qr_remove_mean" to skip the argument handling of slin.qr
+_geqp3_orgqr = {np.dtype(dtype): slin.lapack.get_lapack_funcs(('geqp3', 'orgqr'), (np.empty((1,1), dtype=dtype),))
+                for dtype in (np.float32, np.float64)}
+# optimal workspace sizes of "_geqp3_orgqr", cached for each matrix shape
+_qr_lwork = {}
+
 def svd(X : ndarray,
         full_matrices : bool,
-        compute_uv : bool):
+        compute_uv : bool,
+        overwrite_a : bool = False,
+        lapack_driver : str = 'gesvd'):
+    """
+    SVD by LAPACK gesvd following matlab
+
+    If overwrite_a, X may be destroyed to avoid copying it. Only use it for temporary matrices.
+
+    lapack_driver can be 'gesdd' (divide-and-conquer), which is faster.
+    If gesdd does not converge, gesvd is used instead.
+    """
+    if lapack_driver not in ('gesvd', 'gesdd'):
+        raise ValueError('Unknown lapack_driver')
+    if X.dtype not in _gesvd or X.size == 0:
+        return _svd_scipy(X, full_matrices, compute_uv)
+    if lapack_driver == 'gesdd':
+        # X is kept for the gesvd fallback
+        L, D, M, info = _gesdd[X.dtype](X, compute_uv=compute_uv, full_matrices=full_matrices)
+        if info > 0:
+            return svd(X, full_matrices, compute_uv, overwrite_a = overwrite_a)
+    else:
+        L, D, M, info = _gesvd[X.dtype](X, compute_uv=compute_uv, full_matrices=full_matrices, overwrite_a=overwrite_a)
+    if info > 0:
+        raise nplin.LinAlgError("SVD did not converge")
+    if info < 0:
+        raise ValueError('illegal value in %d-th argument of internal %s' % (-info, lapack_driver))
+    if compute_uv:
+        return L, D, M
+    else:
+        return D
+
+def _svd_scipy(X : ndarray,
+               full_matrices : bool,
+               compute_uv : bool):
     if compute_uv:
         L, D, M = slin.svd(X,
                             full_matrices=full_matrices,
@@ -34,6 +81,22 @@ def svd(X : ndarray,
                         lapack_driver='gesvd')
         return D
 
+def max_singular_value(X : ndarray) -> Union[float, ndarray]:
+    """
+    Calculate the largest singular value of X
+
+    It is the square root of the largest eigenvalue of the smaller Gram matrix of X,
+    which is cheaper than a full SVD when only the top singular value is required.
+    Stacked matrices (..., M, N) are computed in one batched call and 
+    their largest singular values (...) are returned.
+    """
+    X_T = np.swapaxes(X, -1, -2)
+    if X.shape[-2] <= X.shape[-1]:
+        G = X @ X_T
+    else:
+        G = X_T @ X
+    return np.sqrt(np.maximum(nplin.eigvalsh(G)[..., -1], 0))
+
 def cholesky(M : ndarray):
     """
     Calculate cholesky decomposition of M. If M is not positive definite matrix, the nearest positive definite matrix for M will be created.
@@ -127,6 +190,47 @@ def eigvec(X : ndarray,
 
     return eig_vec
 
+def eigvec_sym(X : ndarray,
+               Y : Optional[ndarray] = None,
+               n_vec : Optional[int] = None):
+    """
+    Calculate eigenvectors of real symmetric matrix 
+    or real symmetric-definite generalized problem
+
+    Results are same as "eigvec" except signs of eigenvectors. 
+    Symmetric solvers are faster than general "eig" and always return real values.
+
+    Parameters
+    -----------------
+    X : ndarray
+        Real symmetric matrix. 
+        If Y is None, stacked matrices (..., N, N) are also supported.
+    Y : ndarray
+        Real symmetric positive definite matrix.
+        If Y is given, eig(X, Y) will be computed. 
+        If Y is not positive definite, "eigvec" will be used.
+    n_vec : Optional[int]
+        If given, only eigenvectors of the n_vec largest eigenvalues are computed, 
+        which is cheaper than the full eigendecomposition.
+        Stacked matrices are not supported in this case.
+
+    Returns
+    ---------------
+    eig_vec : ndarray
+        Eigenvectors. The order follows the corresponding eigenvalues (from high to low values)
+    """
+    if Y is None and n_vec is None:
+        _, eig_v = nplin.eigh(X)
+    else:
+        subset_by_index = None if n_vec is None else [X.shape[-1] - n_vec, X.shape[-1] - 1]
+        try:
+            # eigenvectors are normalized as eig_v.T @ Y @ eig_v = I, same as "eigvec"
+            _, eig_v = slin.eigh(X, Y, check_finite = False, subset_by_index = subset_by_index)
+        except nplin.LinAlgError:
+            return eigvec(X, Y)[:, :n_vec]
+    # eigenvalues from "eigh" are in ascending order
+    return eig_v[..., ::-1]
+
 def sum_list(X: list) -> ndarray:
     """
     Calculate sum of a list
@@ -180,14 +284,11 @@ def blkmat(X: ndarray):
         (trial_num, channel_num, signal_len)
     """
     trial_num, channel_num, signal_len = X.shape
-    blkmatrix = np.ndarray([])
+    # allocate the whole matrix once and fill diagonal blocks
+    blkmatrix = np.zeros((trial_num * channel_num, trial_num * signal_len), dtype = X.dtype)
     for trial_idx in range(trial_num):
-        if len(blkmatrix.shape)==0:
-            blkmatrix = X[trial_idx,:,:]
-        else:
-            A1 = np.concatenate((blkmatrix, np.zeros((blkmatrix.shape[0], signal_len))), axis = 1)
-            A2 = np.concatenate((np.zeros((channel_num, blkmatrix.shape[1])), X[trial_idx,:,:]), axis = 1)
-            blkmatrix = np.concatenate((A1, A2), axis = 0)
+        blkmatrix[(trial_idx*channel_num):((trial_idx+1)*channel_num),
+                  (trial_idx*signal_len):((trial_idx+1)*signal_len)] = X[trial_idx,:,:]
     return blkmatrix
 
 def blkrep(X: ndarray,
@@ -202,14 +303,11 @@ def blkrep(X: ndarray,
     N : int
         Number of X in the diag line
     """
-    blkmatrix = np.ndarray([])
-    for _ in range(N):
-        if len(blkmatrix.shape)==0:
-            blkmatrix = X
-        else:
-            A1 = np.concatenate((blkmatrix, np.zeros((blkmatrix.shape[0], X.shape[1]))), axis = 1)
-            A2 = np.concatenate((np.zeros((X.shape[0], blkmatrix.shape[1])), X), axis = 1)
-            blkmatrix = np.concatenate((A1, A2), axis = 0)
+    row_num, col_num = X.shape
+    # allocate the whole matrix once and fill diagonal blocks
+    blkmatrix = np.zeros((N * row_num, N * col_num), dtype = X.dtype)
+    for n in range(N):
+        blkmatrix[(n*row_num):((n+1)*row_num), (n*col_num):((n+1)*col_num)] = X
     return blkmatrix
 
 
@@ -232,10 +330,9 @@ def sort(X: list) -> Tuple[list, list, list]:
     """
     sort_idx = list(np.argsort(X))
     sorted_X = [X[i] for i in sort_idx]
-    return_idx = [None] * len(sort_idx)
-    for loc, idx in enumerate(sort_idx):
-        return_idx[idx] = loc
-    return sorted_X, sort_idx, return_idx
+    return_idx = np.empty(len(sort_idx), dtype = int)
+    return_idx[sort_idx] = np.arange(len(sort_idx))
+    return sorted_X, sort_idx, return_idx.tolist()
 
 def separate_trainSig(X: List[ndarray],
                       Y: List[int]) -> List[ndarray]:
@@ -304,15 +401,91 @@ def gen_template(X: List[ndarray],
     for i in unique_Y:
         # i-th class trial index
         target_idx = [k for k in range(len(Y)) if Y[k] == unique_Y[i]]
-        # Get i-th class training data
-        template_sig_single = [np.expand_dims(X[k], axis=0) for k in target_idx]
-        template_sig_single = np.concatenate(template_sig_single, axis=0)
         # Average all i-th class training data
-        template_sig_single = np.mean(template_sig_single, axis=0)
+        #   Trials are accumulated in one preallocated array instead of being concatenated first
+        #   Same as np.mean, integer data are averaged in float64
+        dtype = X[target_idx[0]].dtype if np.issubdtype(X[target_idx[0]].dtype, np.inexact) else np.float64
+        template_sig_single = np.array(X[target_idx[0]], dtype = dtype)
+        for k in target_idx[1:]:
+            template_sig_single += X[k]
+        template_sig_single /= len(target_idx)
         # Store i-th class template
         template_sig.append(template_sig_single)
     return template_sig
 
+def corrcoef_rows(A: ndarray,
+                  B: ndarray,
+                  overwrite_input: bool = False) -> ndarray:
+    """
+    Pearson correlation coefficients between corresponding rows of A and B
+
+    Parameters
+    ----------
+    A : ndarray
+        (..., N)
+    B : ndarray
+        (..., N)
+    overwrite_input : bool
+        If True, means are removed from A and B in place to avoid copying them. 
+        Only use it for temporary arrays.
+
+    Returns
+    -------
+    r : ndarray
+        (...)
+    """
+    if overwrite_input:
+        A -= np.mean(A, axis = -1, keepdims = True)
+        B -= np.mean(B, axis = -1, keepdims = True)
+    else:
+        A = A - np.mean(A, axis = -1, keepdims = True)
+        B = B - np.mean(B, axis = -1, keepdims = True)
+    r = np.einsum('...n,...n->...', A, B) / np.sqrt(np.einsum('...n,...n->...', A, A) * np.einsum('...n,...n->...', B, B))
+    return r
+
+def normalize_rows(A: ndarray) -> ndarray:
+    """
+    Remove mean of each row of A and scale it to unit norm
+
+    Pearson correlation coefficients of normalized rows are their dot products.
+
+    Parameters
+    ----------
+    A : ndarray
+        (..., N)
+
+    Returns
+    -------
+    A_normalized : ndarray
+        (..., N)
+    """
+    A = A - np.mean(A, axis = -1, keepdims = True)
+    return A / np.sqrt(np.einsum('...n,...n->...', A, A))[..., np.newaxis]
+
+def sum_signed_square(R: List[ndarray]) -> ndarray:
+    """
+    Sum of sign(r) * r^2 (= r * |r|) over a list of correlation arrays
+
+    Computation is done in place, so the arrays in R are overwritten 
+    and the result is stored in R[0].
+
+    Parameters
+    ----------
+    R : List[ndarray]
+        List of correlation arrays with the same shape
+
+    Returns
+    -------
+    r : ndarray
+        Same shape as the arrays in R
+    """
+    r = R[0]
+    np.multiply(r, np.abs(r), out = r)
+    for r_tmp in R[1:]:
+        np.multiply(r_tmp, np.abs(r_tmp), out = r_tmp)
+        r += r_tmp
+    return r
+
 def canoncorr(X: ndarray, 
               Y: ndarray,
               force_output_UV: Optional[bool] = False) -> Union[Tuple[ndarray, ndarray, ndarray], ndarray]:
@@ -341,32 +514,69 @@ def canoncorr(X: ndarray,
     Q2, T22, perm2 = qr_remove_mean(Y)
     
     svd_X = Q1.T @ Q2
+    if not force_output_UV:
+        # Only singular values are required, which are computed by the faster divide-and-conquer driver.
+        # Singular vectors of gesdd may differ from gesvd in rounding, so gesvd is kept for A and B.
+        return svd(svd_X, False, False, overwrite_a = True, lapack_driver = 'gesdd')
     if svd_X.shape[0]>svd_X.shape[1]:
         full_matrices=False
     else:
         full_matrices=True
         
-    L, D, M = slin.svd(svd_X,
-                     full_matrices=full_matrices,
-                     check_finite=False,
-                     lapack_driver='gesvd')
+    L, D, M = svd(svd_X, full_matrices, True, overwrite_a = True)
     M = M.T
     
     r = D
     
-    if force_output_UV:
-        A = mldivide(T11, L) * np.sqrt(n - 1)
-        B = mldivide(T22, M) * np.sqrt(n - 1)
-        A_r = np.zeros(A.shape)
-        for i in range(A.shape[0]):
-            A_r[perm1[i],:] = A[i,:]
-        B_r = np.zeros(B.shape)
-        for i in range(B.shape[0]):
-            B_r[perm2[i],:] = B[i,:]
-            
-        return A_r, B_r, r
-    else:
-        return r
+    A = _mldivide_qr_R(T11, L) * np.sqrt(n - 1)
+    B = _mldivide_qr_R(T22, M) * np.sqrt(n - 1)
+    # undo column pivoting by fancy-index assignment
+    A_r = np.empty_like(A)
+    A_r[perm1,:] = A
+    B_r = np.empty_like(B)
+    B_r[perm2,:] = B
+        
+    return A_r, B_r, r
+
+def canoncorr_stack(X: ndarray,
+                    Y: ndarray) -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Canonical correlation analysis of stacked data by "canoncorr"
+
+    Each pair is decomposed by "canoncorr", so that column pivoting, 
+    rank-deficiency handling and signs of A and B are the same as calling "canoncorr" for each pair. 
+    Outputs are written into preallocated arrays.
+
+    Parameters
+    ----------
+    X : ndarray
+        (... * n * p1)
+    Y : ndarray
+        (... * n * p2)
+        Leading dimensions of X and Y are broadcast
+
+    Returns
+    -------
+    A : ndarray
+        (... * p1 * K), where K is the number of columns of A of "canoncorr"
+    B : ndarray
+        (... * p2 * p2)
+    r : ndarray
+        (... * min(p1, p2))
+    """
+    batch_shape = np.broadcast_shapes(X.shape[:-2], Y.shape[:-2])
+    # broadcast views keep the layout of each pair
+    X = np.broadcast_to(X, batch_shape + X.shape[-2:])
+    Y = np.broadcast_to(Y, batch_shape + Y.shape[-2:])
+    A, B, r = None, None, None
+    for idx in np.ndindex(*batch_shape):
+        A_tmp, B_tmp, r_tmp = canoncorr(X[idx], Y[idx], force_output_UV = True)
+        if A is None:
+            A = np.empty(batch_shape + A_tmp.shape, dtype = A_tmp.dtype)
+            B = np.empty(batch_shape + B_tmp.shape, dtype = B_tmp.dtype)
+            r = np.empty(batch_shape + r_tmp.shape, dtype = r_tmp.dtype)
+        A[idx], B[idx], r[idx] = A_tmp, B_tmp, r_tmp
+    return A, B, r
 
 def qr_inverse(Q: ndarray, 
                R: ndarray,
@@ -394,17 +604,19 @@ def qr_inverse(Q: ndarray,
     """
     if len(Q.shape)==2: # reference
         tmp = Q @ R
-        X = np.zeros(tmp.shape)
-        for i in range(X.shape[1]):
-            X[:,P[i]] = tmp[:,i]
+        X = np.empty_like(tmp)
+        X[:,P] = tmp
     elif len(Q.shape)==3: # template
-        X = [np.expand_dims(qr_inverse(Q[i,:,:], R[i,:,:], P[i,:]), axis=0) for i in range(Q.shape[0])]
-        X = np.concatenate(X, axis=0)
+        # all filterbanks are reconstructed by one batched matmul and one scatter of columns
+        tmp = Q @ R
+        X = np.empty_like(tmp)
+        np.put_along_axis(X, np.expand_dims(P, axis=1), tmp, axis=-1)
     else:
         raise ValueError('Unknown data type')
     return X
 
-def qr_list(X : List[ndarray]) -> Tuple[List[ndarray], List[ndarray], List[ndarray]]:
+def qr_list(X : List[ndarray],
+            pivoting : bool = True) -> Tuple[Union[List[ndarray], ndarray], Union[List[ndarray], ndarray], Union[List[ndarray], ndarray]]:
     """
     QR decomposition of list X
     Note: Elements in X will be transposed first and then decomposed
@@ -412,39 +624,123 @@ def qr_list(X : List[ndarray]) -> Tuple[List[ndarray], List[ndarray], List[ndarr
     Parameters
     ----------
     X : List[ndarray]
+    pivoting : bool
+        Whether column pivoting is applied. The default is True.
+        If False, all matrices are decomposed by one batched "numpy.linalg.qr" 
+        and P are identity permutations. Only use it when Q is the only required output, 
+        e.g. for projection matrices Q @ Q.T.
 
     Returns
     -------
-    Q : List[ndarray]
-    R : List[ndarray]
-    P : List[ndarray]
+    Q : Union[List[ndarray], ndarray]
+    R : Union[List[ndarray], ndarray]
+    P : Union[List[ndarray], ndarray]
+        If all elements in X have the same shape, results are stacked along the first axis, 
+        e.g. (stimulus_num * signal_len * harmonic_num) for Q of references.
+        They can be indexed and iterated in the same way as lists.
     """
+    if len(X[0].shape) not in (2, 3):
+        raise ValueError('Unknown data type')
+    if len(set(el.shape for el in X)) == 1:
+        # All elements are transposed and their means are removed in one batched operation.
+        # Column pivoting is kept, so each matrix is still decomposed by LAPACK separately, 
+        # but matrices are decomposed in place without copying.
+        X_remove_mean = np.swapaxes(np.stack(X, axis = 0), -1, -2)
+        X_remove_mean = X_remove_mean - np.mean(X_remove_mean, axis = -2, keepdims = True)
+        if not pivoting:
+            Q, R = np.linalg.qr(X_remove_mean, mode = 'reduced')
+            P = np.broadcast_to(np.arange(X_remove_mean.shape[-1]), R.shape[:-2] + (R.shape[-1],))
+            return Q, R, P
+        batch_shape = X_remove_mean.shape[:-2]
+        Q, R, P = _qr_pivoting_economic_batch(X_remove_mean.reshape((-1,) + X_remove_mean.shape[-2:]))
+        Q = np.reshape(Q, batch_shape + Q.shape[1:])
+        R = np.reshape(R, batch_shape + R.shape[1:])
+        P = np.reshape(P, batch_shape + P.shape[1:])
+        return Q, R, P
     Q = []
     R = []
     P = []
-    for el in X:
-        if len(el.shape) == 2: # reference signal
-            Q_tmp, R_tmp, P_tmp = qr_remove_mean(el.T)
+    # all elements share one format, so the type is checked once
+    if len(X[0].shape) == 2: # reference signal
+        for el in X:
+            Q_tmp, R_tmp, P_tmp = qr_remove_mean(el.T, pivoting = pivoting)
             Q.append(Q_tmp)
             R.append(R_tmp)
             P.append(P_tmp)
-        elif len(el.shape) == 3: # template signal
-            Q_tmp = []
-            R_tmp = []
-            P_tmp = []
-            for k in range(el.shape[0]):
-                Q_tmp_tmp, R_tmp_tmp, P_tmp_tmp = qr_remove_mean(el[k,:,:].T)
-                Q_tmp.append(np.expand_dims(Q_tmp_tmp, axis=0))
-                R_tmp.append(np.expand_dims(R_tmp_tmp, axis=0))
-                P_tmp.append(np.expand_dims(P_tmp_tmp, axis=0))
-            Q.append(np.concatenate(Q_tmp,axis=0))
-            R.append(np.concatenate(R_tmp,axis=0))
-            P.append(np.concatenate(P_tmp,axis=0))
-        else:
-            raise ValueError('Unknown data type')
+    elif len(X[0].shape) == 3: # template signal
+        for el in X:
+            X_remove_mean = np.swapaxes(el, -1, -2)
+            X_remove_mean = X_remove_mean - np.mean(X_remove_mean, axis = -2, keepdims = True)
+            if pivoting:
+                Q_tmp, R_tmp, P_tmp = _qr_pivoting_economic_batch(X_remove_mean)
+            else:
+                Q_tmp, R_tmp = np.linalg.qr(X_remove_mean, mode = 'reduced')
+                P_tmp = np.broadcast_to(np.arange(X_remove_mean.shape[-1]), R_tmp.shape[:-2] + (R_tmp.shape[-1],))
+            Q.append(Q_tmp)
+            R.append(R_tmp)
+            P.append(P_tmp)
+    else:
+        raise ValueError('Unknown data type')
     return Q, R, P
 
-def qr_remove_mean(X: ndarray) -> Tuple[ndarray, ndarray, ndarray]:
+def qr_inverse_list(Q : List[ndarray],
+                    R : List[ndarray],
+                    P : List[ndarray]) -> List[ndarray]:
+    """
+    Inverse QR decomposition of lists generated by "qr_list"
+    Note: Reconstructed elements will be transposed back. Because of "qr_remove_mean", their means have been removed.
+
+    Parameters
+    ----------
+    Q : List[ndarray]
+    R : List[ndarray]
+    P : List[ndarray]
+
+    Returns
+    -------
+    X : Union[List[ndarray], ndarray]
+        If Q, R and P are stacked by "qr_list", all elements are reconstructed by one batched matmul 
+        and returned stacked along the first axis.
+    """
+    if isinstance(Q, ndarray) and isinstance(R, ndarray) and isinstance(P, ndarray):
+        if len(Q.shape) not in (3, 4):
+            raise ValueError('Unknown data type')
+        tmp = Q @ R
+        X = np.empty_like(tmp)
+        np.put_along_axis(X, np.expand_dims(P, axis=-2), tmp, axis=-1)
+        return np.swapaxes(X, -1, -2)
+    X = [qr_inverse(Q_tmp, R_tmp, P_tmp) for Q_tmp, R_tmp, P_tmp in zip(Q, R, P)]
+    if len(X[0].shape)==2: # reference
+        X = [X_tmp.T for X_tmp in X]
+    elif len(X[0].shape)==3: # template
+        X = [np.transpose(X_tmp, (0,2,1)) for X_tmp in X]
+    else:
+        raise ValueError('Unknown data type')
+    return X
+
+def pinv_list(R : List[ndarray]) -> List[ndarray]:
+    """
+    Pseudo-inverse of R of lists generated by "qr_list"
+    Note: "mldivide(R, B)" equals to "pinv_list(R)" @ B, 
+          so that the pseudo-inverse can be computed once and reused for different B
+
+    Parameters
+    ----------
+    R : List[ndarray]
+
+    Returns
+    -------
+    R_pinv : List[ndarray]
+    """
+    if len(R[0].shape)==2: # reference
+        return [pinv(R_tmp) for R_tmp in R]
+    elif len(R[0].shape)==3: # template
+        return [np.stack([pinv(R_tmp[k,:,:]) for k in range(R_tmp.shape[0])], axis = 0) for R_tmp in R]
+    else:
+        raise ValueError('Unknown data type')
+
+def qr_remove_mean(X: ndarray,
+                   pivoting: bool = True) -> Tuple[ndarray, ndarray, ndarray]:
     """
     Remove column mean and QR decomposition 
 
@@ -452,6 +748,9 @@ def qr_remove_mean(X: ndarray) -> Tuple[ndarray, ndarray, ndarray]:
     ----------
     X : ndarray
         (M * N)
+    pivoting : bool
+        Whether column pivoting is applied. The default is True.
+        If False, P is the identity permutation.
 
     Returns
     -------
@@ -465,10 +764,102 @@ def qr_remove_mean(X: ndarray) -> Tuple[ndarray, ndarray, ndarray]:
     
     X_remove_mean = X - np.mean(X,0)
     
-    Q, R, P = slin.qr(X_remove_mean, mode = 'economic', pivoting = True)
+    if not pivoting:
+        Q, R = np.linalg.qr(X_remove_mean, mode = 'reduced')
+        return Q, R, np.arange(X_remove_mean.shape[1])
+    Q, R, P = _qr_pivoting_economic(X_remove_mean)
     
     return Q, R, P
 
+def _qr_pivoting_economic(X: ndarray) -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Economic QR decomposition with column pivoting, same as 
+    slin.qr(X, mode = 'economic', pivoting = True)
+
+    SSVEP signals are small, so that argument handling and workspace queries of slin.qr
+    take a large part of its time. Here LAPACK is called directly with cached workspace sizes.
+    X is destroyed. Only use it for temporary matrices.
+    """
+    if X.dtype not in _geqp3_orgqr or X.ndim != 2 or X.size == 0:
+        return slin.qr(X, mode = 'economic', pivoting = True)
+    if not np.isfinite(X).all():
+        raise ValueError("array must not contain infs or NaNs")
+    geqp3, orgqr = _geqp3_orgqr[X.dtype]
+    M, N = X.shape
+    key = (X.dtype, M, N)
+    if key not in _qr_lwork:
+        lwork_geqp3 = int(geqp3(X, lwork = -1)[-2][0].real)
+        lwork_orgqr = int(orgqr(X[:, :min(M, N)], np.empty(min(M, N), dtype = X.dtype), lwork = -1)[-2][0].real)
+        _qr_lwork[key] = (lwork_geqp3, lwork_orgqr)
+    lwork_geqp3, lwork_orgqr = _qr_lwork[key]
+    qr, P, tau, _, info = geqp3(X, lwork = lwork_geqp3, overwrite_a = True)
+    if info < 0:
+        raise ValueError('illegal value in %d-th argument of internal geqp3' % -info)
+    P -= 1 # 1-based index returned by geqp3
+    if M < N:
+        R = np.triu(qr)
+        qr = qr[:, :M]
+    else:
+        R = np.triu(qr[:N, :])
+    Q, _, info = orgqr(qr, tau, lwork = lwork_orgqr, overwrite_a = True)
+    if info < 0:
+        raise ValueError('illegal value in %d-th argument of internal orgqr' % -info)
+    return Q, R, P
+
+def _qr_pivoting_economic_batch(X: ndarray) -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    "_qr_pivoting_economic" of stacked matrices
+
+    Results are written into preallocated arrays instead of being collected in lists and stacked.
+    X is destroyed. Only use it for temporary matrices.
+
+    Parameters
+    ----------
+    X : ndarray
+        (B * M * N)
+
+    Returns
+    -------
+    Q : ndarray
+        (B * M * K)
+    R : ndarray
+        (B * K * N)
+    P : ndarray
+        (B * N)
+    """
+    # the first decomposition gives shapes and types of outputs
+    Q_tmp, R_tmp, P_tmp = _qr_pivoting_economic(X[0])
+    Q = np.empty((X.shape[0],) + Q_tmp.shape, dtype = Q_tmp.dtype)
+    R = np.empty((X.shape[0],) + R_tmp.shape, dtype = R_tmp.dtype)
+    P = np.empty((X.shape[0],) + P_tmp.shape, dtype = P_tmp.dtype)
+    Q[0], R[0], P[0] = Q_tmp, R_tmp, P_tmp
+    for b in range(1, X.shape[0]):
+        Q[b], R[b], P[b] = _qr_pivoting_economic(X[b])
+    return Q, R, P
+
+def _mldivide_qr_R(R: ndarray,
+                   B: ndarray) -> ndarray:
+    """
+    R\B for the R factor of QR decomposition with column pivoting
+
+    R is upper triangular, so that the back substitution is used instead of the pseudo-inverse.
+    Magnitudes of diagonal elements of R are non-increasing because of pivoting. 
+    If R is not square or is rank deficient, "mldivide" is used.
+
+    Parameters
+    ----------
+    R : ndarray
+    B : ndarray
+
+    Returns
+    -------
+    x: ndarray
+    """
+    R_diag = np.abs(np.diag(R))
+    if R.shape[0] != R.shape[1] or R_diag.size == 0 or R_diag[-1] <= max(R.shape) * np.finfo(R.dtype).eps * R_diag[0]:
+        return mldivide(R, B)
+    return slin.solve_triangular(R, B, check_finite = False)
+
 def mldivide(A: ndarray,
              B: ndarray) -> ndarray:
     """
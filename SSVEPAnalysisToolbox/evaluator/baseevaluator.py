@@ -15,6 +15,10 @@ import pickle
 import copy
 
 from joblib import Parallel, delayed
+try:
+    from joblib import parallel_config
+except ImportError: # joblib < 1.3 only provides the deprecated "parallel_backend"
+    from joblib import parallel_backend as parallel_config
 from functools import partial
 
 import warnings
@@ -571,15 +575,19 @@ class BaseEvaluator:
             #     pbar = create_pbar([len(self.trial_container), len(self.model_container)*2])
             # pbar_update_val = 1
                 
-        self.performance_container, self.trained_model_container = zip(*pbarParallel(n_jobs=n_jobs,timeout=timeout,loop_list_num=[len(self.trial_container)],use_tqdm=self.disp_processbar)
-                                                                                               (delayed(partial(_run_loop, model_container = self.model_container,
-                                                                                                                           trial_container = self.trial_container,
-                                                                                                                           dataset_container = self.dataset_container,
-                                                                                                                           ignore_stim_phase = self.ignore_stim_phase,
-                                                                                                                           eval_train = eval_train,
-                                                                                                                           save_model = self.save_model
-                                                                                                                           ))(trial_idx = trial_idx) 
-                                                                                                                           for trial_idx in range(len(self.trial_container))))
+        # Trials are evaluated in parallel processes and models in each process run sequentially, 
+        # so BLAS of each process is limited to one thread to avoid oversubscribing CPUs. 
+        # "n_jobs" is also given to the backend because "Parallel" takes its default "n_jobs" from there.
+        with parallel_config('loky', n_jobs = 1 if n_jobs is None else n_jobs, inner_max_num_threads = 1):
+            self.performance_container, self.trained_model_container = zip(*pbarParallel(n_jobs=n_jobs,timeout=timeout,loop_list_num=[len(self.trial_container)],use_tqdm=self.disp_processbar)
+                                                                                                   (delayed(partial(_run_loop, model_container = self.model_container,
+                                                                                                                               trial_container = self.trial_container,
+                                                                                                                               dataset_container = self.dataset_container,
+                                                                                                                               ignore_stim_phase = self.ignore_stim_phase,
+                                                                                                                               eval_train = eval_train,
+                                                                                                                               save_model = self.save_model
+                                                                                                                               ))(trial_idx = trial_idx) 
+                                                                                                                               for trial_idx in range(len(self.trial_container))))
         
         if self.disp_processbar:
             # pbar.close()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from SSVEPAnalysisToolbox.algorithms.utils import canoncorr, canoncorr_stack
+
+class TestCanoncorrStack(unittest.TestCase):
+    def _check_same_as_canoncorr(self, X, Y):
+        A, B, r = canoncorr_stack(X, Y)
+        batch_shape = np.broadcast_shapes(X.shape[:-2], Y.shape[:-2])
+        X = np.broadcast_to(X, batch_shape + X.shape[-2:])
+        Y = np.broadcast_to(Y, batch_shape + Y.shape[-2:])
+        for idx in np.ndindex(*batch_shape):
+            A_ref, B_ref, r_ref = canoncorr(X[idx], Y[idx], force_output_UV = True)
+            np.testing.assert_array_equal(A[idx], A_ref)
+            np.testing.assert_array_equal(B[idx], B_ref)
+            np.testing.assert_array_equal(r[idx], r_ref)
+
+    def test_broadcast(self):
+        rng = np.random.default_rng(0)
+        # (stimulus_num * filterbank_num * n * channel_num) and (stimulus_num * 1 * n * harmonic_num)
+        X = np.swapaxes(rng.standard_normal((4, 3, 9, 500)), -1, -2)
+        Y = np.swapaxes(rng.standard_normal((4, 1, 10, 500)), -1, -2)
+        self._check_same_as_canoncorr(X, Y)
+
+    def test_rank_deficient(self):
+        rng = np.random.default_rng(1)
+        X = rng.standard_normal((2, 200, 6))
+        X[..., 5] = X[..., 0] + X[..., 1]
+        Y = rng.standard_normal((2, 200, 4))
+        self._check_same_as_canoncorr(X, Y)
+
+if __name__ == '__main__':
+    unittest.main()